@@ -1,6 +1,7 @@
 import json
 import boto3
 from boto3.dynamodb.conditions import Key
+from batching import BatchGet
 
 #Dynamo DB Resource
 dynamodb = boto3.resource('dynamodb')
@@ -9,37 +10,36 @@ dynamodb = boto3.resource('dynamodb')
 Machine_Table = dynamodb.Table('Machines')
 Parent_Table = dynamodb.Table('Parent_Tasks')
 
+#Parent Task fields returned to the UI
+parentFields = ('Parent_Id, Machine_Id, #N, Description, Frequency, '
+                'Start_Date, Completion_Time')
+
 def ViewParentsByMachine(params):
 
     #Parameters
     machineId = params['MachineId']
 
-    #List Vars
     parentIds = []
-    parentTasks = []
 
-    #Get Machine
-    machine = Machine_Table.query(
-        KeyConditionExpression=Key('Machine_Id').eq(machineId)
-    )['Items'][0]
+    #Get Machine (only its task ids)
+    machine = Machine_Table.get_item(
+        Key={'Machine_Id': machineId},
+        ProjectionExpression='Tasks'
+    )['Item']
 
     #Get Parent Task Ids From Machine
     if 'Tasks' in machine:
         parentIds = list(machine['Tasks'])
 
-    #Get Each Parent Task
-    for pid in parentIds:
-        
-        #Query Parent Task
-        pTask = Parent_Table.query(
-            KeyConditionExpression=Key('Parent_Id').eq(pid)
-        )['Items'][0]
-
-        #Delete Decimal Attr
-        del pTask['Active']
+    #Get Parent Tasks with batched gets, only the fields the UI shows
+    parentTasks = BatchGet('Parent_Tasks',
+        [{'Parent_Id': pid} for pid in parentIds],
+        projection=parentFields,
+        names={'#N': 'Name'}
+    )
 
-        #Add Task to List
-        parentTasks.append(pTask)
+    #Batch results come back in any order
+    parentTasks.sort(key=lambda p: p['Name'])
 
     return parentTasks
 
@@ -1,6 +1,7 @@
 import json
 import boto3
 from boto3.dynamodb.conditions import Key
+from cache import BumpVersions
 
 dynamodb = boto3.resource('dynamodb')
 dynamodb_client = boto3.client('dynamodb')
@@ -42,6 +43,9 @@ def addMachine(id, machine_type, machine_name):
 
     #Add New Machine to Db
     machine_table.put_item(Item=newMachine)
+
+    #Cached names and type lists are now out of date
+    BumpVersions('Machines', 'Machine_Types')
     
     #Success
     return 1
@@ -1,6 +1,7 @@
 import json
 import boto3
 from boto3.dynamodb.conditions import Key
+from cache import BumpVersions
 
 dynamodb = boto3.resource('dynamodb')
 dynamodb_client = boto3.client('dynamodb')
@@ -27,6 +28,9 @@ def addMachineType(machine_type):
         }
     )
 
+    #Cached type lists are now out of date
+    BumpVersions('Machine_Types')
+
     #Success
     return 1
     
@@ -1,106 +1,54 @@
 import json
 import boto3
 from datetime import datetime
-from boto3.dynamodb.conditions import Key
+from jobs import EnqueueJob
+from cache import BumpVersions
 
 dynamodb = boto3.resource('dynamodb')
 dynamodb_client = boto3.client('dynamodb')
 
 #deletes machine and marks assiciated tasks as inactive
+#The machine is marked Deleting here and a background job handles its
+#   tasks, then removes it from the Machines and Machine_Types tables.
+#Returns the Job_Id, None if the machine doesn't exist
 def deleteMachine(id, machine_type):
-    
+
     #Table Resources
     machine_table = dynamodb.Table('Machines')
-    parent_table = dynamodb.Table('Parent_Tasks')
-    child_table = dynamodb.Table('Child_Tasks')
-    type_table = dynamodb.Table('Machine_Types')
 
     #Get machine
-    machine = machine_table.query(
-        KeyConditionExpression=Key('Machine_Id').eq(id)
-    )['Items'][0]
-
-    parents = []
+    machine = machine_table.get_item(
+        Key={'Machine_Id': id},
+        ProjectionExpression='Machine_Id'
+    ).get('Item')
 
-    #Get Parent Tasks from Machine
-    if 'Tasks' in machine:
-        parents = list(machine['Tasks'])
-
-    #Each task for machine
-    for pid in parents:
-                
-        #mark parent tasks as inactive
-        parent_table.update_item(
-            Key={
-                'Parent_Id': pid
-            },
-            UpdateExpression="SET Active = :inactive",
-            ExpressionAttributeValues={
-                ':inactive': 0
-            },
-        )
+    if machine is None:
+        return None
 
-        #Today Due Date
-        today = datetime.now().strftime('%Y%m%d')
-        
-        #Grab children of task
-        children = child_table.query(
-            TableName= 'Child_Tasks', 
-            IndexName= "Parent_Index",
-            KeyConditionExpression=
-                Key('Parent_Id').eq(pid)
-        )['Items']
-
-        #Each child task of parent
-        for child in children:      
-            
-            #Mark Inactive if passed due
-            if child['Due_Date'] < today:
-                child_table.update_item(
-                    TableName= 'Child_Tasks', 
-                    Key={
-                        'Parent_Id': pid,
-                        'Due_Date' : child['Due_Date']
-                    },
-                    UpdateExpression="SET Active = :zero",
-                    ExpressionAttributeValues={
-                        ':zero': 0
-                    },
-                )
-            #Delete if upcoming
-            else:
-                child_table.delete_item(
-                    Key = {
-                        'Parent_Id' : pid,
-                        'Due_Date' : child['Due_Date']
-                    }
-                )
-    
-
-    #delete machine from machine table
-    response = machine_table.delete_item(
+    #Mark machine so it is known to be part way through deletion
+    #   (new tasks can't be added to it and the views leave it out)
+    machine_table.update_item(
         Key={
             'Machine_Id': id
-        }
+        },
+        UpdateExpression="SET Deleting = :one",
+        ExpressionAttributeValues={
+            ':one': 1
+        },
     )
 
-    #delete machine from machine types table
-    try:    
-        type_table.update_item(
-            Key={
-                'Machine_Type': machine_type
-            },
-            UpdateExpression="DELETE Machines :id",
-            ExpressionAttributeValues={
-                ':id': {id}
-            },
-        )
-    except:
-        print("Machine could not be delete from Machine Type.")
-        
-    return response
+    #Cached machine names drop it too
+    BumpVersions('Machines')
 
-#input: ?machine_id=<id>&machine_type=<Type
+    #Tasks are handled in the background
+    return EnqueueJob('DeleteMachine', {
+        'Machine_Id': id,
+        'Machine_Type': machine_type,
+        'Today': datetime.now().strftime('%Y%m%d')
+    })
+
+#input: ?machine_id=<id>&machine_type=<Type>
+#returns 202 with the Job_Id of the background delete
 def deleteMachineHandler(event, context):
     
     params = event['queryStringParameters']
@@ -144,13 +92,26 @@ def deleteMachineHandler(event, context):
     machine_type = params['machine_type']
 
     #Call function
-    deleteMachine(id, machine_type)
+    jobId = deleteMachine(id, machine_type)
+
+    #Send error response
+    if jobId is None:
+        return {
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': "Machine does not exist"
+        }
     
-    #Send Response
+    #Send Response (check progress with the job status API)
     return{
-        'statusCode': 200,
+        'statusCode': 202,
         'headers':{
             'Content-Type': 'text/plain'
         },
-        'body': "Deleted machine: " + id
-    }
\ No newline at end of file
+        'body': json.dumps({
+            'Message': "Deleting machine: " + id,
+            'Job_Id': jobId
+        })
+    }
@@ -1,6 +1,7 @@
 import json
 import boto3
 from boto3.dynamodb.conditions import Key
+from cache import BumpVersions
 
 dynamodb = boto3.resource('dynamodb')
 dynamodb_client = boto3.client('dynamodb')
@@ -17,6 +18,9 @@ def deleteMachineType(machine_type):
         }
     )
 
+    #Cached type lists are now out of date
+    BumpVersions('Machine_Types')
+
     #Send Response
     return response
 
@@ -1,6 +1,7 @@
 import json
 import boto3
 from boto3.dynamodb.conditions import Key
+from cache import BumpVersions
 
 dynamodb = boto3.resource('dynamodb')
 dynamodb_client = boto3.client('dynamodb')
@@ -34,6 +35,9 @@ def editMachineName(id, newName):
         }
     )
 
+    #Cached names are now out of date
+    BumpVersions('Machines')
+
     #Send Success
     return 1
 
@@ -54,6 +54,18 @@ def viewMachineHandler(event, context):
     #Call function
     machine = getMachineById(id)
 
+    #Send error response, the machine is going away
+    if 'Deleting' in machine:
+        return {
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : 'Machine is being deleted: ' + id
+            })
+        }
+
     #Convert Task Set to List
     if 'Tasks' in machine:
         machine['Tasks'] = list(machine['Tasks'])
@@ -1,48 +1,84 @@
+import base64
 import json
 import boto3
 from boto3.dynamodb.conditions import Key
+from batching import BatchGet
+from cache import GetMachineIdsByType, GetMachineNames
 
 dynamodb = boto3.resource('dynamodb')
 dynamodb_client = boto3.client('dynamodb')
 
-#gets machine id by type in Machine_Types
+#gets machine id by type from the cached Machine_Types list
+#machines being deleted are left out (they have no cached name)
 def getMachineIdsByType(type):
-    
-    #Machine Types Table
-    table = dynamodb.Table('Machine_Types')
-    
-    #Get Machine Type
-    response = table.query(
-        KeyConditionExpression=Key('Machine_Type').eq(type)
-    )
-
-    #Send Ids From Machine Type
-    if 'Machines' in response['Items'][0]:
-        return list(response['Items'][0]['Machines'])
-    
-    #Return Empty List if No Machine
-    else:
-        return []
-        
 
-#Gets Machine Details By Id
-def getMachineById(id):
-    
-    #Machine Table Resource
-    table = dynamodb.Table('Machines')
-    
-    #Get Machines
-    response = table.query(
-        KeyConditionExpression=Key('Machine_Id').eq(id)
-    )
+    #Return Empty List if No Machine (or no such type)
+    ids = list(GetMachineIdsByType(type) or [])
+    names = GetMachineNames(ids)
+
+    return [mid for mid in ids if mid in names]
+
+
+#Gets Machine Details for a list of ids with batched gets
+def getMachinesByIds(ids):
+
+    #Get Machines (100 per call)
+    machines = BatchGet('Machines', [{'Machine_Id': mid} for mid in ids])
+
+    #Convert Task Sets to Lists
+    for machine in machines:
+        if 'Tasks' in machine:
+            machine['Tasks'] = list(machine['Tasks'])
+
+    #Put Machines back in the order of the ids (skipping any that started
+    #   being deleted since the names were cached)
+    byId = {m['Machine_Id']: m for m in machines if 'Deleting' not in m}
+    return [byId[mid] for mid in ids if mid in byId]
 
-    #Send Machine
-    return response['Items'][0]
+#Cursors are the last machine id of a page, base64 encoded
+def encodeCursor(machineId):
+    return base64.urlsafe_b64encode(machineId.encode()).decode()
 
-#calls getMachineIdByType first to get the machine id and then calls
-#getMachineById to get the machine information
-#currently it returns list of ids instead of all information
+#raises ValueError if cursor isn't one
+def decodeCursor(cursor):
+    try:
+        last = base64.b64decode(cursor.encode('ascii'), altchars=b'-_',
+                                validate=True).decode('utf-8')
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+    if not last:
+        raise ValueError('Invalid cursor')
+
+    return last
+
+#gets (limit, last machine id) from the paging params, either can be None
+#raises ValueError for a bad limit or cursor
+def getPaging(params):
+
+    limit = None
+    last = None
+
+    if 'limit' in params:
+        try:
+            limit = int(params['limit'])
+        except (ValueError, TypeError):
+            raise ValueError('limit must be a whole number')
+
+        if limit < 1:
+            raise ValueError('limit must be at least 1')
+
+    if 'cursor' in params:
+        last = decodeCursor(params['cursor'] or '')
+
+    return limit, last
+
+#calls getMachineIdsByType first to get the machine ids and then
+#getMachinesByIds to get the machine information in batches
 #input: ?machine_type=<Type> (case sensitive)
+#   optional &limit=<n>&cursor=<NextCursor> to page through machines,
+#   the response is then {"Machines": [...], "NextCursor": <cursor|null>}
+#   optional &ids_only=true to only return the machine ids
 def viewMachineByTypesHandler(event, context):
     
     params = event['queryStringParameters']
@@ -71,32 +107,67 @@ def viewMachineByTypesHandler(event, context):
             }) 
         }
 
+    #Check the paging params
+    try:
+        limit, last = getPaging(params)
+    except ValueError as e:
+        return{
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                    'Message' : str(e),
+            })
+        }
+
     #Set param values
     machine_type = params['machine_type']
 
-    #Get Machine Ids of Type
-    machine_ids = getMachineIdsByType(machine_type)
+    try:
+        #Get Machine Ids of Type (sorted so pages are stable)
+        machine_ids = sorted(getMachineIdsByType(machine_type))
 
-    ret_obj = []
-    
-    #Each id in machine ids list
-    for mid in machine_ids:
-        
-        #Get Machine By Id
-        machine = getMachineById(mid)
+        #Skip machines returned by earlier pages
+        if last is not None:
+            machine_ids = [mid for mid in machine_ids if mid > last]
 
-        #Convert Task Set to List
-        if 'Tasks' in machine:
-            machine['Tasks'] = list(machine['Tasks'])
-        
-        #Add Machine to List
-        ret_obj.append(machine)
-
-    #Send Response
-    return{
-        'statusCode': 200,
-        'headers':{
-            'Content-Type': 'text/plain'
-        },
-        'body': json.dumps(ret_obj)
-    }
+        next_cursor = None
+
+        #Cut down to one page
+        if limit is not None and len(machine_ids) > limit:
+            machine_ids = machine_ids[:limit]
+            next_cursor = encodeCursor(machine_ids[-1])
+
+        #Ids only, or full machine records
+        if params.get('ids_only') == 'true':
+            ret_obj = machine_ids
+        else:
+            ret_obj = getMachinesByIds(machine_ids)
+
+        #Wrap the page with its cursor
+        if 'limit' in params or 'cursor' in params:
+            ret_obj = {
+                'Machines': ret_obj,
+                'NextCursor': next_cursor
+            }
+
+        #Send Response
+        return{
+            'statusCode': 200,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps(ret_obj)
+        }
+    except Exception as e:
+        #Return exception with response
+        return{
+            'statusCode': 500,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : str(e)
+            })
+        }
@@ -1,50 +1,31 @@
 import json
 import boto3
 from boto3.dynamodb.conditions import Key
+from cache import GetMachineTypes, GetMachineNames
 
 dynamodb = boto3.resource('dynamodb')
 dynamodb_client = boto3.client('dynamodb')
 
-#queries entire table
+#gets every machine type with its machine names
+#both come from the warm cache when it is current
 def viewMachineTypes():
 
-    #Machine Types Table
-    typeTable = dynamodb.Table('Machine_Types')
-    machineTable = dynamodb.Table('Machines')
-    
-    #Scan Table
-    response = typeTable.scan()
-    
-    #Results of Scan
-    types = response['Items']
-
-    #Extension of Scan
-    while 'LastEvaluatedKey' in response:
-        response = typeTable.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-        data.extend(response['Items'])
+    #Machine Types (Machines already converted to lists)
+    types = GetMachineTypes()
 
-    #Each Machine Type
+    #Every machine id across all types
+    machineIds = set()
     for item in types:
-        
-        machineNames = []
+        machineIds.update(item['Machines'])
 
-        #Convert Machine Id Sets to List
-        if 'Machines' in item:
-            item['Machines'] = list(item['Machines'] )
+    #Get all machine names (only cache misses hit the table)
+    names = GetMachineNames(machineIds)
 
-        #Each Machine Id
-        for mid in item['Machines']:
-            
-            #Get Machine
-            machine = machineTable.query(
-                KeyConditionExpression=Key('Machine_Id').eq(mid)
-            )['Items'][0]
-
-            #Add Name to List
-            machineNames.append(machine['Name'])
-
-        #Add List of Machine Names to Object
-        item['Machine_Names'] = machineNames
+    #Add List of Machine Names to Each Type (machines being deleted have
+    #   no name and are left out)
+    for item in types:
+        item['Machines'] = [mid for mid in item['Machines'] if mid in names]
+        item['Machine_Names'] = [names[mid] for mid in item['Machines']]
 
     #Send Data
     return types
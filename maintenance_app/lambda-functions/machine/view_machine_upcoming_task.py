@@ -3,6 +3,12 @@ import json
 from datetime import datetime, timedelta
 from boto3.dynamodb.conditions import Key
 from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from paging import QueryItems
+from batching import BatchGet
+from threads import GetThreadTable, ParallelMap
+from cache import ChildrenBackfilled
+from occurrences import virtualUpcoming, VirtualChildren, MergeUpcoming
 
 #Get the service resource.
 dynamodb = boto3.resource('dynamodb')
@@ -12,8 +18,20 @@ Machine_Table = dynamodb.Table('Machines')
 Parent_Table = dynamodb.Table('Parent_Tasks')
 Child_Table = dynamodb.Table('Child_Tasks')
 
+#Get upcoming children of one parent (job: (pid, today, future, childFilter))
+def QueryParent(job):
+
+    pid, today, future, childFilter = job
+
+    return list(QueryItems(GetThreadTable('Child_Tasks'),
+        IndexName= "Parent_Index",
+        KeyConditionExpression=
+            Key('Parent_Id').eq(pid) &
+            Key('Due_Date').between(today, future),
+        FilterExpression=childFilter
+    ))
+
 #Needs to do the following
-    #Get Parent Tasks From Machine
     #Grab upcoming task in child db (use DueDate/MachineId)
     #Make Sure to Filter Inactive Tasks and Completed Tasks
 def ViewUpcomingMachineTasks(params):
@@ -22,44 +40,66 @@ def ViewUpcomingMachineTasks(params):
     daysForward = int(params['DaysForward'])
     machineId = params['MachineId']
 
-    #Get Machine
-    machine = Machine_Table.query(
-        KeyConditionExpression=Key('Machine_Id').eq(machineId)
-    )['Items'][0]
+    #DueDate Ranges
+    today = datetime.now().strftime("%Y%m%d")
+    future = (datetime.now() + timedelta(days=daysForward)).strftime("%Y%m%d")
+
+    #Virtual mode needs completed children to know which dates are covered
+    if virtualUpcoming:
+        childFilter = Attr('Active').eq(1)
+    else:
+        childFilter = Attr('Active').eq(1)&Attr('Completed').eq(0)
+
+    children = None
+
+    #Grab upcoming children of Machine between range
+    #   (old children only have Machine_Id once they've been backfilled)
+    if ChildrenBackfilled():
+        try:
+            children = list(QueryItems(Child_Table,
+                IndexName= "Machine_Index",
+                KeyConditionExpression=
+                    Key('Machine_Id').eq(machineId) &
+                    Key('Due_Date').between(today, future),
+                FilterExpression=childFilter
+            ))
+        except ClientError as e:
+            #Index not created on this table yet
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
 
-    
-    parents = []
-    tasks = []
-    
     #Get Parent Tasks from Machine
-    if 'Tasks' in machine:
-        parents = list(machine['Tasks'])
-
-    #Query Parent Tasks
-    for pid in parents:
-
-        #DueDate Ranges
-        today = datetime.now().strftime("%Y%m%d")
-        future = (datetime.now() + timedelta(days=daysForward)).strftime("%Y%m%d")
-
-        #Grab upcoming children of Parent between range
-        children = Child_Table.query(
-            TableName= 'Child_Tasks', 
-            IndexName= "Parent_Index",
-            KeyConditionExpression=
-                Key('Parent_Id').eq(pid) &
-                Key('Due_Date').between(today, future),
-            FilterExpression=Attr('Active').eq(1)&Attr('Completed').eq(0)
-        )['Items']
-
-        #Remove Decimal Fields
-        for child in children:
-            del child['Active']
-            del child['Completed']
-            del child['Late']
-
-        #Append Task to List
-        tasks = tasks + children
+    if children is None or virtualUpcoming:
+        machine = Machine_Table.get_item(
+            Key={'Machine_Id': machineId},
+            ProjectionExpression='Tasks'
+        ).get('Item', {})
+        parentIds = list(machine.get('Tasks', []))
+
+    #Fallback - Query each parent task in parallel
+    if children is None:
+        children = []
+        jobs = [(pid, today, future, childFilter) for pid in parentIds]
+        for parentChildren in ParallelMap(QueryParent, jobs):
+            children.extend(parentChildren)
+        children.sort(key=lambda child: child['Due_Date'])
+
+    #Add future occurrences of the machine's tasks that haven't been written
+    if virtualUpcoming:
+        parents = BatchGet('Parent_Tasks',
+            [{'Parent_Id': pid} for pid in parentIds])
+
+        children = MergeUpcoming(children,
+            VirtualChildren(parents, today, future))
+
+    tasks = []
+
+    #Remove Decimal Fields and Append Task to List
+    for child in children:
+        del child['Active']
+        del child['Completed']
+        del child['Late']
+        tasks.append(child)
 
     return tasks
 
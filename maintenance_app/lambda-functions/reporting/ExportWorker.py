@@ -0,0 +1,15 @@
+from jobs import RunJob
+from ExportHistory import ExportHistoryStep
+from ExportMachineHistory import ExportMachineHistoryStep
+
+#Job types run by the export worker
+exportSteps = {
+    'ExportHistory': ExportHistoryStep,
+    'ExportMachineHistory': ExportMachineHistoryStep
+}
+
+#Builds exports enqueued by ExportHistory and ExportMachineHistory
+#Invoked asynchronously with {"Job_Id": <id>}
+def ExportWorkerHandler(event, context):
+
+    return RunJob(event, context, exportSteps)
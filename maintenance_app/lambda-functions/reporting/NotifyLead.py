@@ -2,6 +2,7 @@ import boto3
 import os
 from bs4 import BeautifulSoup
 from boto3.dynamodb.conditions import Key, Attr
+from paging import QueryItems
 from datetime import datetime, timedelta
 
 # Get the service resources
@@ -72,11 +73,11 @@ def GetIncompleteTasks():
     today = datetime.now().strftime('%Y%m%d')
 
     #Get Today's Incomplete Child Tasks
-    children = Child_Table.query(
+    children = list(QueryItems(Child_Table,
         KeyConditionExpression=Key('Due_Date').eq(today),
         FilterExpression=Attr('Completed').eq(0)
             &Attr('Active').eq(1)
-    )['Items']
+    ))
 
     return children
 
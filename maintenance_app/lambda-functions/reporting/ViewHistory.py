@@ -1,14 +1,6 @@
-import boto3
 import json
-from datetime import datetime, timedelta
-from boto3.dynamodb.conditions import Key, Attr
-
-# Get the service resource.
-dynamodb = boto3.resource('dynamodb')
-
-#Get Table Objects
-Child_Table = dynamodb.Table('Child_Tasks')
-Parent_Table = dynamodb.Table('Parent_Tasks')
+from history import (HistoryRange, FetchParentHistory, FetchDailyHistory, RunPipeline, JsonSink,
+                     PageSize, EncodeCursor, DecodeCursor, DailyHistoryPage)
 
 #Scans Parent Table
 def AltViewHistory(params):
@@ -16,74 +8,11 @@ def AltViewHistory(params):
     #Get Param
     daysBack = int(params['DaysBack'])
 
-    #Denote variables
-    items = []
-    missed = 0
-    complete = 0
-
     #Calculate days
-    yest = (datetime.now()-timedelta(days=1)).strftime('%Y%m%d')
-    past = (datetime.now()-timedelta(days=daysBack)).strftime('%Y%m%d')
-
-    #Scan Parent Table
-    parents = Parent_Table.scan(
-        FilterExpression=Attr('Active').eq(1)
-    )['Items']
-
-    #Iterate through Parent Ids
-    for p in parents:
-
-        #Query Child Table
-        children = Child_Table.query(
-            IndexName= "Parent_Index",
-            KeyConditionExpression=
-                Key('Parent_Id').eq(p['Parent_Id']) &
-                Key('Due_Date').between(past, yest),
-                FilterExpression=Attr('Active').eq(1)
-        )['Items']
-
-        #Iterate through children
-        for child in children:
-
-            #Calculate Date Completed
-            if child['Completed']:
-                completed_on = datetime.fromtimestamp(
-                    float(child['Completed_DateTime'])
-                ).strftime('%c')
-            else:
-                completed_on = ''
-                
-            #Determine Task Status
-            if child['Completed'] and child['Late']:
-                status = 'Late'
-            elif child['Completed']:
-                status = 'Complete'
-                complete += 1
-            else:
-                status = 'Missed'
-                missed += 1
-
-            #Add additional fields
-            child['Completed_On'] = completed_on
-            child['Status'] = status
-
-            #Remove Fields
-            del child['Active']
-            del child['Late']
-            del child['Completed']
-            del child['Completed_DateTime']
-
-            #Add task to list
-            items.append(child)
-
-    #Build result object
-    result = {
-        'Items': items,
-        'Missed': missed,
-        'Complete': complete
-    }
+    past, yest = HistoryRange(daysBack)
 
-    return result
+    #Every active parent's children, a window of parents at a time
+    return RunPipeline(FetchParentHistory(past, yest), JsonSink)
 
 #Dear Future Capstone Student - Use this if Alt View History
 #   becomes slow. This doesn't rely on scan, so the size of
@@ -95,66 +24,31 @@ def ViewHistory(params):
     #Get Param
     days = int(params['DaysBack'])
 
-    #Denote variables
-    items = []
-    missed = 0
-    complete = 0
-
-    #Iterate through tasks
-    for daysBack in range(1, days+1):
-
-        #Calculate key for due date
-        dueDate = (datetime.now()-timedelta(days=daysBack)).strftime('%Y%m%d')
-
-        #Get tasks due for calculated due date
-        children = Child_Table.query(
-            KeyConditionExpression=
-                Key('Due_Date').eq(dueDate),
-            FilterExpression=Attr('Active').eq(1)
-        )['Items']
-
-        #Iterate through children
-        for child in children:
-
-            #Calculate Date Completed
-            if child['Completed']:
-                completed_on = datetime.fromtimestamp(
-                    float(child['Completed_DateTime'])
-                ).strftime('%c')
-            else:
-                completed_on = ''
-                
-            #Determine Task Status
-            if child['Completed'] and child['Late']:
-                status = 'Late'
-            elif child['Completed']:
-                status = 'Complete'
-                complete += 1
-            else:
-                status = 'Missed'
-                missed += 1
-
-            #Add additional fields
-            child['Completed_On'] = completed_on
-            child['Status'] = status
-
-            #Remove Fields
-            del child['Active']
-            del child['Late']
-            del child['Completed']
-            del child['Completed_DateTime']
-
-            items.append(child)
-
-    #Build result object
-    result = {
-        'Items': items,
-        'Missed': missed,
-        'Complete': complete
-    }
+    #Children due each day from yesterday back
+    return RunPipeline(FetchDailyHistory(1, days), JsonSink)
+
+#One page of history, newest day first (?PageSize=<n> and/or ?Cursor=<c>)
+#   Counts are for the page, ViewHistorySummary has the window's totals
+def ViewHistoryPage(params):
+
+    pageSize = PageSize(params)
+
+    #Carry on from the last page, or start at yesterday
+    if params.get('Cursor'):
+        state = DecodeCursor(params['Cursor'], ['Past', 'Yest', 'Day', 'Key'])
+    else:
+        past, yest = HistoryRange(int(params['DaysBack']))
+        state = {'Past': past, 'Yest': yest, 'Day': yest, 'Key': None}
+
+    children, state = DailyHistoryPage(state, pageSize)
+
+    result = RunPipeline([children], JsonSink)
+    result['Cursor'] = EncodeCursor(state)
 
     return result
 
+#input: ?DaysBack=<n>[&PageSize=<n>][&Cursor=<cursor from the last page>]
+#   Without PageSize or Cursor the whole window comes back at once
 def ViewHistoryHandler(event, context):
 
     reqParams = ['DaysBack']
@@ -189,7 +83,10 @@ def ViewHistoryHandler(event, context):
 
     try:
         #Call function
-        result = AltViewHistory(paramVals)
+        if 'PageSize' in paramVals or 'Cursor' in paramVals:
+            result = ViewHistoryPage(paramVals)
+        else:
+            result = AltViewHistory(paramVals)
 
         #Send Response
         return {
@@ -199,6 +96,17 @@ def ViewHistoryHandler(event, context):
             },
             'body': json.dumps(result)
         }
+    except ValueError as e:
+        #Bad DaysBack, PageSize or Cursor
+        return {
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : str(e)
+            })
+        }
     except Exception as e:
         #Return exception with response
         return {
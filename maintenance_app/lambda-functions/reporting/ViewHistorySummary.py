@@ -0,0 +1,125 @@
+import json
+from rollups import ReadRollups, counterNames
+from history import (HistoryRange, FetchParentHistory, FetchMachineHistory,
+                     FetchTaskHistory, Classify, RollupSink)
+
+#Count the window from the children themselves (?Recount=true), e.g. to
+#   check the rollups or cover days from before they were kept
+def RecountHistory(params):
+
+    #Calculate days
+    past, yest = HistoryRange(int(params['DaysBack']))
+
+    #Pick the children to count
+    if 'MachineId' in params:
+        batches = FetchMachineHistory(params['MachineId'], past, yest)
+    elif 'ParentId' in params:
+        batches = FetchTaskHistory(params['ParentId'], past, yest)
+    else:
+        batches = FetchParentHistory(past, yest)
+
+    #Counting doesn't need the Format stage
+    return RollupSink(Classify(batches))
+
+#Complete/Late/Missed counts for a DaysBack window from the daily rollups
+#   instead of reading every child in the window
+def ViewHistorySummary(params):
+
+    #Get Param
+    daysBack = int(params['DaysBack'])
+
+    #Pick rollup scope
+    if 'MachineId' in params:
+        scope = 'MACHINE#' + params['MachineId']
+    elif 'ParentId' in params:
+        scope = 'PARENT#' + params['ParentId']
+    else:
+        scope = 'ALL'
+
+    #Calculate days
+    past, yest = HistoryRange(daysBack)
+
+    #Denote variables
+    days = []
+    totals = {name: 0 for name in counterNames}
+
+    #One item per day with activity
+    for item in ReadRollups(scope, past, yest):
+
+        day = {'Day': item['Day']}
+
+        for name in counterNames:
+            day[name] = int(item.get(name, 0))
+            totals[name] += day[name]
+
+        days.append(day)
+
+    #Build result object
+    result = {
+        'Days': days,
+        'Complete': totals['Complete'],
+        'Late': totals['Late'],
+        'Missed': totals['Missed']
+    }
+
+    return result
+
+#input: ?DaysBack=<n>[&MachineId=<id> | &ParentId=<id>][&Recount=true]
+def ViewHistorySummaryHandler(event, context):
+
+    reqParams = ['DaysBack']
+
+    #Get Query Params
+    paramVals = event["queryStringParameters"]
+
+    #Return client error if no string params
+    if (paramVals is None):
+        return{
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : 'Failed to provide query string parameters.'
+            })
+        }
+
+    #Check for each parameter we need
+    for name in reqParams:
+        if (name not in paramVals):
+            return {
+                'statusCode': 400,
+                'headers':{
+                    'Content-Type': 'text/plain'
+                },
+                'body': json.dumps({
+                    'Message' : 'Failed to provide parameter: ' + name
+                })
+            }
+
+    try:
+        #Call function
+        if str(paramVals.get('Recount', '')).lower() in ('1', 'true'):
+            result = RecountHistory(paramVals)
+        else:
+            result = ViewHistorySummary(paramVals)
+
+        #Send Response
+        return {
+            'statusCode': 200,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps(result)
+        }
+    except Exception as e:
+        #Return exception with response
+        return {
+            'statusCode': 500,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : str(e)
+            })
+        }
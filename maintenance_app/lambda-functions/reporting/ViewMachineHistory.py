@@ -1,14 +1,6 @@
-import boto3
 import json
-from datetime import datetime, timedelta
-from boto3.dynamodb.conditions import Key, Attr
-
-# Get the service resource.
-dynamodb = boto3.resource('dynamodb')
-
-#Get Table Objects
-Child_Table = dynamodb.Table('Child_Tasks')
-Machine_Table = dynamodb.Table('Machines')
+from history import (HistoryRange, FetchMachineHistory, RunPipeline, JsonSink,
+                     PageSize, EncodeCursor, DecodeCursor, MachineHistoryPage)
 
 def ViewMachineHistory(params):
 
@@ -16,79 +8,37 @@ def ViewMachineHistory(params):
     machineId = params['MachineId']
     daysBack = int(params['DaysBack'])
 
-    #Denote variables
-    items = []
-    missed = 0
-    complete = 0
-
-    #Query Machine for Tasks
-    machine = Machine_Table.query(
-        KeyConditionExpression=Key('Machine_Id').eq(machineId)
-    )['Items'][0]
-
-    #Convert Set of Tasks to List
-    if 'Tasks' in machine:
-        machine['Tasks'] = list(machine['Tasks'])
-
-    #Each Parent Tasks for Machine
-    for pid in machine['Tasks']:
-
-        #Calculate days
-        yest = (datetime.now()-timedelta(days=1)).strftime('%Y%m%d')
-        past = (datetime.now()-timedelta(days=daysBack)).strftime('%Y%m%d')
-
-        #Query Child Table
-        children = Child_Table.query(
-            IndexName= "Parent_Index",
-            KeyConditionExpression=
-                Key('Parent_Id').eq(pid) &
-                Key('Due_Date').between(past, yest),
-            FilterExpression=Attr('Active').eq(1)
-        )['Items']
-
-        #Iterate through children
-        for child in children:
-
-            #Calculate Date Completed
-            if child['Completed']:
-                completed_on = datetime.fromtimestamp(
-                    float(child['Completed_DateTime'])
-                ).strftime('%c')
-            else:
-                completed_on = ''
-                
-            #Determine Task Status
-            if child['Completed'] and child['Late']:
-                status = 'Late'
-            elif child['Completed']:
-                status = 'Complete'
-                complete += 1
-            else:
-                status = 'Missed'
-                missed += 1
-
-            #Add additional fields
-            child['Completed_On'] = completed_on
-            child['Status'] = status
-
-            #Remove Fields
-            del child['Active']
-            del child['Late']
-            del child['Completed']
-            del child['Completed_DateTime']
-
-            #Add task to list
-            items.append(child)
-
-    #Build result object
-    result = {
-        'Items': items,
-        'Missed': missed,
-        'Complete': complete
-    }
+    #Calculate days
+    past, yest = HistoryRange(daysBack)
+
+    #The machine's children, a page at a time
+    return RunPipeline(FetchMachineHistory(machineId, past, yest), JsonSink)
+
+#One page of a machine's history, oldest first (?PageSize=<n> and/or
+#   ?Cursor=<c>). Counts are for the page, ViewHistorySummary has the
+#   window's totals
+def ViewMachineHistoryPage(params):
+
+    pageSize = PageSize(params)
+
+    #Carry on from the last page, or start at the beginning of the window
+    if params.get('Cursor'):
+        state = DecodeCursor(params['Cursor'], ['MachineId', 'Past', 'Yest', 'Key'])
+        if state['MachineId'] != params['MachineId']:
+            raise ValueError('Cursor is for a different machine')
+    else:
+        past, yest = HistoryRange(int(params['DaysBack']))
+        state = {'MachineId': params['MachineId'], 'Past': past, 'Yest': yest, 'Key': None}
+
+    children, state = MachineHistoryPage(state, pageSize)
+
+    result = RunPipeline([children], JsonSink)
+    result['Cursor'] = EncodeCursor(state)
 
     return result
 
+#input: ?DaysBack=<n>&MachineId=<id>[&PageSize=<n>][&Cursor=<cursor>]
+#   Without PageSize or Cursor the whole window comes back at once
 def ViewMachineHistoryHandler(event, context):
 
     reqParams = ['DaysBack', 'MachineId']
@@ -123,7 +73,10 @@ def ViewMachineHistoryHandler(event, context):
 
     try:
         #Call function
-        result = ViewMachineHistory(paramVals)
+        if 'PageSize' in paramVals or 'Cursor' in paramVals:
+            result = ViewMachineHistoryPage(paramVals)
+        else:
+            result = ViewMachineHistory(paramVals)
 
         #Send Response
         return {
@@ -133,6 +86,17 @@ def ViewMachineHistoryHandler(event, context):
             },
             'body': json.dumps(result)
         }
+    except ValueError as e:
+        #Bad DaysBack, PageSize or Cursor
+        return {
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : str(e)
+            })
+        }
     except Exception as e:
         #Return exception with response
         return {
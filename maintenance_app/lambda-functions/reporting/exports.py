@@ -0,0 +1,292 @@
+#Shared code for the history exports: the file sinks of the history
+#pipeline (see history.py) and getting the files to S3.
+#Workbooks are written in xlsxwriter's constant_memory mode: each row is
+#flushed to a temp file in /tmp as soon as the next row starts, so memory
+#use stays flat no matter how many children are exported. Rows have to be
+#written in order in this mode, which is why the totals go on their own
+#Summary sheet instead of next to the headers. The finished file is
+#uploaded to S3 in parts straight from disk.
+#
+#Besides xlsx (the default) an export can be a gzip CSV or a Parquet file
+#(?Format=csv or ?Format=parquet). Both carry the raw due date, ids and an
+#ISO completion time for analytics tools, and both are streamed: CSV a row
+#at a time and Parquet a row group at a time. Parquet files are written by
+#parquet.py, so no pyarrow is needed in the function.
+#
+#Files are keyed by a hash of the report, machine, date range and the
+#History version stamp (bumped whenever a past child changes), so a repeat
+#request is answered with a link to the file already in S3 and different
+#requests never write over each other.
+#
+#Large exports can run in the background (?Async=true): the API returns a
+#Job_Id and ExportWorker builds the file. JobStatus hands back a download
+#link once the job is Done.
+import csv
+import gzip
+import hashlib
+import json
+import os
+import uuid
+import boto3
+import xlsxwriter
+from botocore.exceptions import ClientError
+from boto3.s3.transfer import TransferConfig
+from jobs import AddProgress
+from cache import GetVersion, historyNamespace
+from history import HistoryRange, RunPipeline, NewCounts, DisplayTime, IsoTime
+from parquet import WriteParquet
+
+#Get client for s3 Upload
+s3client = boto3.client('s3')
+
+#Seconds a download link stays valid
+expires = 900
+
+#Files over 8 MB are uploaded in 8 MB parts, 4 at a time
+transferConfig = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=4
+)
+
+#Children per Parquet row group
+rowGroupSize = int(os.environ.get('exportRowGroup', '50000'))
+
+#Columns of the CSV and Parquet exports
+dataColumns = ['Due_Date', 'Parent_Id', 'Machine_Id', 'Task_Name',
+               'Machine_Name', 'Completed_By', 'Completed_On', 'Status']
+
+#Add the Past..Yest due dates an export of the last DaysBack days covers
+def ExportRange(params):
+
+    past, yest = HistoryRange(int(params['DaysBack']))
+
+    return dict(params, Past=past, Yest=yest)
+
+#S3 key for a report over params' Past..Yest as the data is right now
+#   name: file name without the extension
+def ExportKey(report, params, name):
+
+    stamp = json.dumps({
+        'Report': report,
+        'MachineId': params.get('MachineId', ''),
+        'Past': params['Past'],
+        'Yest': params['Yest'],
+        'Format': params.get('Format', 'xlsx'),
+        'Version': GetVersion(historyNamespace)
+    }, sort_keys=True)
+
+    extension = exportFormats[params.get('Format', 'xlsx')][0]
+
+    return ('exports/' + hashlib.sha256(stamp.encode('utf-8')).hexdigest() +
+            '/' + name + extension)
+
+#True if an export has already been built
+def ExportExists(bucket, key):
+
+    try:
+        s3client.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            raise
+        return False
+
+    return True
+
+#Batch columns -> xlsx Data sheet rows
+def WorkbookRows(batch):
+
+    return zip([child['Task_Name'] for child in batch['Children']],
+               [child['Machine_Name'] for child in batch['Children']],
+               [child['Completed_By'] for child in batch['Children']],
+               batch['Completed_On'], batch['Status'])
+
+#Batch columns -> dataColumns (CSV rows and Parquet columns)
+def DataColumns(batch):
+
+    children = batch['Children']
+
+    return [[child['Due_Date'] for child in children],
+            [child['Parent_Id'] for child in children],
+            [child.get('Machine_Id', '') for child in children],
+            [child['Task_Name'] for child in children],
+            [child['Machine_Name'] for child in children],
+            [child['Completed_By'] for child in children],
+            batch['Completed_On'],
+            batch['Status']]
+
+#Sink: stream formatted batches into an xlsx file at path
+#Returns the number of children written per status
+def WriteHistoryWorkbook(path, batches):
+
+    counts = NewCounts()
+
+    #Create Excel Workbook/Sheets (row data is spooled to /tmp)
+    workbook = xlsxwriter.Workbook(path, {
+        'constant_memory': True,
+        'tmpdir': '/tmp'
+    })
+    worksheet = workbook.add_worksheet('Data')
+    summary = workbook.add_worksheet('Summary')
+
+    #Format Excel Headers
+    bold = workbook.add_format({'bold': True})
+    worksheet.set_column('A:Z', 18.0)
+    worksheet.set_column('D:D', 22)
+    worksheet.write_row(0, 0, ['Task', 'Machine', 'Comleted By',
+                               'Completed On', 'Completion Status'], bold)
+
+    #Write each batch's rows as it arrives
+    row = 1
+    for batch in batches:
+        for values in WorkbookRows(batch):
+            worksheet.write_row(row, 0, values)
+            row += 1
+        counts.update(batch['Status'])
+
+    #Write Missed/Complete Tasks to the Summary Sheet
+    summary.set_column('A:B', 18.0)
+    summary.write_row(0, 0, ['Completed Tasks', 'Missed Tasks'], bold)
+    summary.write_row(1, 0, [counts['Complete'], counts['Missed']])
+
+    #Close wb object (assembles the xlsx from the temp files)
+    workbook.close()
+
+    return dict(counts)
+
+#Sink: stream formatted batches into a gzip CSV file at path
+#Returns the number of children written per status
+def WriteHistoryCsv(path, batches):
+
+    counts = NewCounts()
+
+    with gzip.open(path, 'wt', newline='', encoding='utf-8') as output:
+        writer = csv.writer(output)
+        writer.writerow(dataColumns)
+
+        #Write each batch's rows as it arrives
+        for batch in batches:
+            writer.writerows(zip(*DataColumns(batch)))
+            counts.update(batch['Status'])
+
+    return dict(counts)
+
+#Sink: stream formatted batches into a Parquet file at path, rowGroupSize
+#children per row group
+#Returns the number of children written per status
+def WriteHistoryParquet(path, batches):
+
+    counts = NewCounts()
+
+    #Buffer batches into row groups
+    def RowGroups():
+        columns = [[] for name in dataColumns]
+
+        for batch in batches:
+            for values, batchValues in zip(columns, DataColumns(batch)):
+                values.extend(batchValues)
+            counts.update(batch['Status'])
+
+            if len(columns[0]) >= rowGroupSize:
+                yield columns
+                columns = [[] for name in dataColumns]
+
+        #Last partial group
+        yield columns
+
+    WriteParquet(path, dataColumns, RowGroups())
+
+    return dict(counts)
+
+#Format -> (file extension, sink, completion time format, content type)
+exportFormats = {
+    'xlsx': ('.xlsx', WriteHistoryWorkbook, DisplayTime,
+             'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('.csv.gz', WriteHistoryCsv, IsoTime, 'application/gzip'),
+    'parquet': ('.parquet', WriteHistoryParquet, IsoTime, 'application/octet-stream')
+}
+
+#Get the requested file format, raises ValueError for one we can't build
+def ExportFormat(params):
+
+    fmt = str(params.get('Format') or 'xlsx').lower()
+
+    if fmt not in exportFormats:
+        raise ValueError('Unsupported format: ' + fmt +
+                         ' (use ' + ', '.join(sorted(exportFormats)) + ')')
+
+    return fmt
+
+#Local file to build an export in
+def ExportPath(key):
+
+    return os.path.join('/tmp', str(uuid.uuid4()) + '-' + os.path.basename(key))
+
+#Link to download an export
+def PresignExport(bucket, key):
+
+    return s3client.generate_presigned_url('get_object',
+                Params={'Bucket': bucket,
+                        'Key': key},
+                ExpiresIn=expires)
+
+#Upload a finished export, the local file is removed either way
+def UploadExport(path, bucket, key, contentType):
+
+    try:
+        #Multipart upload straight from the file
+        s3client.upload_file(path, bucket, key, Config=transferConfig,
+                             ExtraArgs={'ContentType': contentType})
+    finally:
+        os.remove(path)
+
+#Run history batches through the pipeline into a file in format fmt and
+#upload it, returns the number of children written per status
+def BuildExport(batches, bucket, key, fmt='xlsx'):
+
+    extension, sink, formatTime, contentType = exportFormats[fmt]
+    path = ExportPath(key)
+
+    try:
+        counts = RunPipeline(batches, lambda formatted: sink(path, formatted),
+                             formatTime)
+    except Exception:
+        #Don't leave half written files in a warm container
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    UploadExport(path, bucket, key, contentType)
+
+    return counts
+
+#Build and upload the file unless it's already there, returns the url
+#   fetch: function returning the history batches for params
+def ExportChildren(fetch, params, bucket, key):
+
+    if not ExportExists(bucket, key):
+        BuildExport(fetch(params), bucket, key, params.get('Format', 'xlsx'))
+
+    return PresignExport(bucket, key)
+
+#True if the caller asked for a background export (?Async=true)
+def IsAsync(params):
+
+    return str(params.get('Async', '')).lower() in ('1', 'true')
+
+#Run an export as a job step (see jobs.py), fetch is a function that
+#returns the history batches for the job's Params (Bucket and Key say
+#where the file goes)
+def RunExportStep(job, fetch):
+
+    params = job['Params']
+
+    #An identical request may have built it since this job was queued
+    if not ExportExists(params['Bucket'], params['Key']):
+        counts = BuildExport(fetch(params), params['Bucket'], params['Key'],
+                             params.get('Format', 'xlsx'))
+        AddProgress(job, **counts)
+
+    job['Result'] = {'Bucket': params['Bucket'], 'Key': params['Key']}
+
+    return True
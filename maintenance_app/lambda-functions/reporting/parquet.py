@@ -0,0 +1,224 @@
+#Minimal Parquet writer for the history exports, so Parquet files can be
+#built without pyarrow (which isn't available in the Lambda runtime).
+#It only covers what the exports need: every column is a required UTF8
+#string, each row group holds one PLAIN encoded data page per column and
+#pages are gzip compressed. Row groups are written as they arrive and the
+#footer (Thrift compact protocol) is added when the file is closed, so only
+#one row group is held in memory at a time.
+import struct
+import zlib
+
+#Thrift compact protocol field types
+thriftI32 = 5
+thriftI64 = 6
+thriftBinary = 8
+thriftList = 9
+thriftStruct = 12
+
+#Parquet enum values
+byteArrayType = 6
+requiredRepetition = 0
+utf8Converted = 0
+plainEncoding = 0
+rleEncoding = 3
+gzipCodec = 2
+dataPage = 0
+
+#Leading and trailing magic of every Parquet file
+magic = b'PAR1'
+
+#Unsigned LEB128 varint
+def Varint(value):
+
+    out = bytearray()
+
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+#Zigzag encoded varint (Thrift compact ints)
+def ZigZag(value):
+
+    return Varint((value << 1) ^ (value >> 63))
+
+#Encode one Thrift struct
+#   fields: [(field id, type, value)] in id order, None values are left out
+#   List values are (element type, [elements])
+def ThriftStruct(fields):
+
+    out = bytearray()
+    lastId = 0
+
+    for fieldId, fieldType, value in fields:
+
+        if value is None:
+            continue
+
+        #Short form header when the id is close to the last one
+        delta = fieldId - lastId
+        if 0 < delta <= 15:
+            out.append((delta << 4) | fieldType)
+        else:
+            out.append(fieldType)
+            out += ZigZag(fieldId)
+        lastId = fieldId
+
+        out += ThriftValue(fieldType, value)
+
+    out.append(0)
+
+    return bytes(out)
+
+#Encode one Thrift value of a type
+def ThriftValue(valueType, value):
+
+    if valueType in (thriftI32, thriftI64):
+        return ZigZag(value)
+
+    if valueType == thriftBinary:
+        if isinstance(value, str):
+            value = value.encode('utf-8')
+        return Varint(len(value)) + value
+
+    if valueType == thriftStruct:
+        return ThriftStruct(value)
+
+    if valueType == thriftList:
+        elementType, elements = value
+
+        if len(elements) < 15:
+            header = bytes([(len(elements) << 4) | elementType])
+        else:
+            header = bytes([0xF0 | elementType]) + Varint(len(elements))
+
+        return header + b''.join(ThriftValue(elementType, element)
+                                 for element in elements)
+
+    raise ValueError('Unsupported Thrift type: ' + str(valueType))
+
+#gzip a page (Parquet's GZIP codec is the gzip file format)
+def Compress(data):
+
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    return compressor.compress(data) + compressor.flush()
+
+#PLAIN encode a column of strings
+def PlainStrings(values):
+
+    out = bytearray()
+
+    for value in values:
+        data = str(value).encode('utf-8')
+        out += struct.pack('<I', len(data))
+        out += data
+
+    return bytes(out)
+
+#Write one column's data page at the file's position
+#   Returns the ColumnChunk fields for the footer
+def WriteColumnChunk(output, name, values):
+
+    offset = output.tell()
+    data = PlainStrings(values)
+    compressed = Compress(data)
+
+    header = ThriftStruct([
+        (1, thriftI32, dataPage),
+        (2, thriftI32, len(data)),
+        (3, thriftI32, len(compressed)),
+        (5, thriftStruct, [
+            (1, thriftI32, len(values)),
+            (2, thriftI32, plainEncoding),
+            (3, thriftI32, rleEncoding),
+            (4, thriftI32, rleEncoding)
+        ])
+    ])
+
+    output.write(header)
+    output.write(compressed)
+
+    uncompressedSize = len(header) + len(data)
+    compressedSize = len(header) + len(compressed)
+
+    metaData = [
+        (1, thriftI32, byteArrayType),
+        (2, thriftList, (thriftI32, [plainEncoding, rleEncoding])),
+        (3, thriftList, (thriftBinary, [name])),
+        (4, thriftI32, gzipCodec),
+        (5, thriftI64, len(values)),
+        (6, thriftI64, uncompressedSize),
+        (7, thriftI64, compressedSize),
+        (9, thriftI64, offset)
+    ]
+
+    return [
+        (2, thriftI64, offset),
+        (3, thriftStruct, metaData)
+    ], uncompressedSize
+
+#Write row groups to a Parquet file at path
+#   names: column names (every column is a UTF8 string)
+#   groups: iterable of row groups, each a list of value lists in names order
+#Returns the number of rows written
+def WriteParquet(path, names, groups):
+
+    rowGroups = []
+    totalRows = 0
+
+    with open(path, 'wb') as output:
+
+        output.write(magic)
+
+        #Each row group's column chunks go straight to the file
+        for columns in groups:
+
+            rows = len(columns[0])
+            if rows == 0:
+                continue
+
+            chunks = []
+            groupSize = 0
+
+            for name, values in zip(names, columns):
+                chunk, size = WriteColumnChunk(output, name, values)
+                chunks.append(chunk)
+                groupSize += size
+
+            rowGroups.append([
+                (1, thriftList, (thriftStruct, chunks)),
+                (2, thriftI64, groupSize),
+                (3, thriftI64, rows)
+            ])
+            totalRows += rows
+
+        #Root element, then one element per column
+        schema = [[
+            (4, thriftBinary, 'schema'),
+            (5, thriftI32, len(names))
+        ]] + [[
+            (1, thriftI32, byteArrayType),
+            (3, thriftI32, requiredRepetition),
+            (4, thriftBinary, name),
+            (6, thriftI32, utf8Converted)
+        ] for name in names]
+
+        footer = ThriftStruct([
+            (1, thriftI32, 1),
+            (2, thriftList, (thriftStruct, schema)),
+            (3, thriftI64, totalRows),
+            (4, thriftList, (thriftStruct, rowGroups)),
+            (6, thriftBinary, 'maintenance-app exports')
+        ])
+
+        output.write(footer)
+        output.write(struct.pack('<I', len(footer)))
+        output.write(magic)
+
+    return totalRows
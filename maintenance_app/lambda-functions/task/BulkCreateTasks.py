@@ -0,0 +1,336 @@
+import base64
+import csv
+import io
+import json
+import uuid
+from datetime import datetime
+from schedule import IsValidFrequency
+from occurrences import ScheduleThrough, ParentsChanged
+from threads import GetThreadTable, ParallelMap
+from cache import GetMachineNames
+
+#Fields every imported task needs (same as CreateTask)
+reqFields = ['TaskName', 'Description', 'Frequency', 'MachineId',
+            'MachineName', 'CompletionTime', 'StartDate']
+
+#Rows written per worker thread
+chunkSize = 50
+
+#Read task rows from a JSON list or a CSV file with a header row
+def ParseRows(body, contentType):
+
+    #CSV upload
+    if 'csv' in contentType or not body.lstrip().startswith(('[', '{')):
+        return list(csv.DictReader(io.StringIO(body)))
+
+    rows = json.loads(body)
+
+    #Allow {"Tasks": [...]} as well as a bare list
+    if isinstance(rows, dict):
+        rows = rows.get('Tasks', [])
+
+    return rows
+
+#Returns an error message for a bad row, or None if it is usable
+def ValidateRow(row):
+
+    if not isinstance(row, dict):
+        return 'Row is not an object'
+
+    for name in reqFields:
+        if not row.get(name):
+            return 'Failed to provide parameter: ' + name
+
+    if len(str(row['StartDate'])) != 8 or not str(row['StartDate']).isdigit():
+        return 'StartDate must be YYYYMMDD'
+
+    if not IsValidFrequency(row['Frequency']):
+        return 'Unsupported frequency: ' + str(row['Frequency'])
+
+    return None
+
+#Parent and child items for a row, raises if its schedule can't be worked out
+def RowItems(parentId, row, today):
+
+    startDate = str(row['StartDate'])
+
+    #Due dates of the child instances written now
+    dueDates, horizon, refillDate = ScheduleThrough(
+        startDate, row['Frequency'], today)
+
+    #Create Parent Task Object
+    parent = {
+        'Parent_Id' : parentId,
+        'Machine_Id' : row['MachineId'],
+        'Name' : row['TaskName'],
+        'Description': row['Description'],
+        'Frequency': row['Frequency'],
+        'Active' : 1,
+        'Start_Date' : startDate,
+        'Completion_Time' : row['CompletionTime'],
+        'Horizon' : horizon,
+        'Refill_Date' : refillDate,
+    }
+
+    #Create Child Instances from Start Date
+    children = [{
+        'Parent_Id' : parentId,
+        'Due_Date': nextDue,
+        'Due_Month': nextDue[:6],
+        'Due_Time': row['CompletionTime'],
+        'Machine_Id': row['MachineId'],
+        'Machine_Name': row['MachineName'],
+        'Frequency': row['Frequency'],
+        'Task_Name' : row['TaskName'],
+        'Completed' : 0,
+        'Late'  : 0,
+        'Completed_By' : '',
+        'Completed_DateTime': '',
+        'Active' : 1
+    } for nextDue in dueDates]
+
+    return parent, children
+
+#Delete a row's children (batch deletes skip ones that were never written)
+def DeleteChildren(parentId, dueDates):
+
+    with GetThreadTable('Child_Tasks').batch_writer() as batch:
+        for dueDate in dueDates:
+            batch.delete_item(Key={'Due_Date': dueDate,
+                                   'Parent_Id': parentId})
+
+#Write one row's children, then its parent
+#   The parent goes last so a row that fails part way never leaves a
+#   parent behind for MaintainTasks to top up
+def WriteRow(parent, children):
+
+    childTable = GetThreadTable('Child_Tasks')
+
+    try:
+        #Flushed when the block ends, so a failure is this row's alone
+        with childTable.batch_writer() as batch:
+            for child in children:
+                batch.put_item(Item=child)
+
+        GetThreadTable('Parent_Tasks').put_item(Item=parent)
+
+    except Exception:
+        #Remove whatever children did get written (best effort)
+        try:
+            DeleteChildren(parent['Parent_Id'],
+                           [child['Due_Date'] for child in children])
+        except Exception:
+            pass
+        raise
+
+#Undo a written row, parent first so MaintainTasks can't top it up
+#   Returns False if anything could not be deleted
+def RemoveRow(entry):
+
+    parentId, dueDates = entry
+
+    try:
+        GetThreadTable('Parent_Tasks').delete_item(
+            Key={
+                'Parent_Id': parentId
+            }
+        )
+        DeleteChildren(parentId, dueDates)
+    except Exception:
+        return False
+
+    return True
+
+#Write parents and children for a chunk of rows, one result per row
+#   Only rows whose items were all written are reported Created
+#Returns the results and {parent id: due dates written} for created rows
+def WriteChunk(chunk):
+
+    results = []
+    written = {}
+    today = datetime.now().strftime('%Y%m%d')
+
+    for index, parentId, row in chunk:
+
+        #Check the row's schedule before writing any of it
+        try:
+            parent, children = RowItems(parentId, row, today)
+        except Exception as e:
+            results.append({'Row': index, 'Status': 'Failed', 'Message': str(e)})
+            continue
+
+        try:
+            WriteRow(parent, children)
+        except Exception as e:
+            results.append({'Row': index, 'Status': 'Failed',
+                            'Message': 'Could not write task: ' + str(e)})
+            continue
+
+        results.append({'Row': index, 'Status': 'Created',
+                        'ParentId': parentId})
+        written[parentId] = [child['Due_Date'] for child in children]
+
+    return results, written
+
+#Add all of a machine's new parent ids in one update
+def AddTasksToMachine(entry):
+
+    machineId, parentIds = entry
+
+    try:
+        GetThreadTable('Machines').update_item(
+            Key={
+                'Machine_Id': machineId,
+            },
+            UpdateExpression="ADD Tasks :newTasks",
+            ConditionExpression="attribute_exists(Machine_Id) AND attribute_not_exists(Deleting)",
+            ExpressionAttributeValues={
+                ':newTasks': set(parentIds)
+            },
+        )
+        return None
+    except Exception as e:
+        return str(e)
+
+def BulkCreateTasks(rows):
+
+    results = {}
+    pending = []
+
+    #Validate every row before writing anything
+    for index, row in enumerate(rows):
+
+        error = ValidateRow(row)
+
+        if error is None:
+            pending.append((index, str(uuid.uuid4()), row))
+        else:
+            results[index] = {'Row': index, 'Status': 'Failed', 'Message': error}
+
+    #Check each machine once (names come from the warm cache)
+    machineIds = set(row['MachineId'] for index, pid, row in pending)
+    exists = GetMachineNames(machineIds)
+
+    valid = []
+    for index, parentId, row in pending:
+        if row['MachineId'] in exists:
+            valid.append((index, parentId, row))
+        else:
+            results[index] = {'Row': index, 'Status': 'Failed',
+                'Message': 'Machine does not exist or is being deleted: ' + row['MachineId']}
+
+    #Write rows in parallel chunks
+    written = {}
+    chunks = [valid[i:i + chunkSize] for i in range(0, len(valid), chunkSize)]
+    for chunkResults, chunkWritten in ParallelMap(WriteChunk, chunks):
+        for result in chunkResults:
+            results[result['Row']] = result
+        written.update(chunkWritten)
+
+    #Group created parents by machine
+    machineTasks = {}
+    for index, parentId, row in valid:
+        if results[index]['Status'] == 'Created':
+            machineTasks.setdefault(row['MachineId'], []).append(index)
+
+    #Update each machine's Tasks set in parallel
+    entries = [(mid, [results[i]['ParentId'] for i in indexes])
+                    for mid, indexes in machineTasks.items()]
+    errors = ParallelMap(AddTasksToMachine, entries)
+
+    #Parents were written but the machine doesn't list them, take them out
+    #   again so a retry of the failed rows doesn't make duplicates
+    for (mid, parentIds), error in zip(entries, errors):
+        if error is None:
+            continue
+
+        removed = ParallelMap(RemoveRow,
+            [(parentId, written[parentId]) for parentId in parentIds])
+
+        for index, ok in zip(machineTasks[mid], removed):
+            if ok:
+                results[index] = {'Row': index, 'Status': 'Failed',
+                    'Message': 'Could not add task to machine: ' + error}
+            else:
+                #Still in the tables, so don't invite a retry
+                results[index]['Warning'] = ('Task was written but could not be ' +
+                    'added to machine: ' + error)
+
+    #Build Response
+    ordered = [results[i] for i in sorted(results)]
+    created = len([r for r in ordered if r['Status'] == 'Created'])
+
+    if created > 0:
+        ParentsChanged()
+
+    return {
+        'Created': created,
+        'Failed': len(ordered) - created,
+        'Results': ordered
+    }
+
+#input: JSON list of task objects (or {"Tasks": [...]}) or a CSV file
+#   with the CreateTask parameter names as headers
+def BulkCreateTasksHandler(event, context):
+
+    body = event.get('body')
+
+    #Return client error if no body
+    if not body:
+        return{
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : 'Failed to provide tasks in request body.'
+            })
+        }
+
+    #Decode binary uploads
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+
+    #Find Content Type
+    headers = event.get('headers') or {}
+    contentType = ''
+    for name in headers:
+        if name.lower() == 'content-type':
+            contentType = headers[name].lower()
+
+    try:
+        rows = ParseRows(body, contentType)
+    except Exception as e:
+        return {
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : 'Could not read tasks: ' + str(e)
+            })
+        }
+
+    try:
+        #Call function
+        result = BulkCreateTasks(rows)
+
+        #Send Response
+        return {
+            'statusCode': 200,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps(result)
+        }
+    except Exception as e:
+        #Return exception with response
+        return {
+            'statusCode': 500,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : str(e)
+            })
+        }
@@ -1,13 +1,43 @@
 import json
 import boto3
 from datetime import datetime
+from botocore.exceptions import ClientError
 from boto3.dynamodb.conditions import Key
+from rollups import ChildStatus, MoveChild, ApplyDeltas
+from occurrences import virtualUpcoming, IsVirtualDate, NewChild, PutIfMissing
+from cache import GetMachineName, BumpVersions, historyNamespace
 
 # Get the service resource.
 dynamodb = boto3.resource('dynamodb')
 
 #Get Table Objects
 Child_Table = dynamodb.Table('Child_Tasks')
+Parent_Table = dynamodb.Table('Parent_Tasks')
+
+#Write a future child that only existed virtually, already completed
+#Returns False if dueDate isn't an occurrence of the parent
+def CompleteVirtualTask(parentId, dueDate, completedBy, when):
+
+    parent = Parent_Table.get_item(
+        Key={'Parent_Id': parentId}
+    ).get('Item')
+
+    if parent is None or not IsVirtualDate(parent, dueDate):
+        return False
+
+    child = NewChild(parent, dueDate, GetMachineName(parent['Machine_Id']) or '')
+    child['Completed'] = 1
+    child['Completed_By'] = completedBy
+    child['Completed_DateTime'] = when
+
+    #MaintainTasks wrote it in the meantime, complete that one instead
+    if not PutIfMissing(Child_Table, child):
+        return None
+
+    #Count it as complete in the daily rollups
+    ApplyDeltas(MoveChild({}, child, None, 'Complete'))
+
+    return True
 
 #Mark Child Instance As Complete
 def CompleteTask(params):
@@ -17,20 +47,55 @@ def CompleteTask(params):
     parentId = params['ParentId']
     completedBy = params['CompletedBy']
 
+    when = str(datetime.now().timestamp())
+
     #Mark Task as Completed
-    Child_Table.update_item(
-        Key={
-            'Parent_Id': parentId,
-            'Due_Date': dueDate
-        },
-        UpdateExpression =
-            "SET Completed = :one, Completed_By = :who, Completed_DateTime = :when",
-        ExpressionAttributeValues={
-            ':one': 1,
-            ':who': completedBy,
-            ':when' : str(datetime.now().timestamp()), 
-        }
-    )
+    try:
+        response = Child_Table.update_item(
+            Key={
+                'Parent_Id': parentId,
+                'Due_Date': dueDate
+            },
+            UpdateExpression =
+                "SET Completed = :one, Completed_By = :who, Completed_DateTime = :when",
+            ConditionExpression="attribute_exists(Due_Date)",
+            ExpressionAttributeValues={
+                ':one': 1,
+                ':who': completedBy,
+                ':when' : when, 
+            },
+            ReturnValues='ALL_OLD'
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+        #Child only exists virtually, write it completed
+        written = False
+        if virtualUpcoming:
+            written = CompleteVirtualTask(parentId, dueDate, completedBy, when)
+
+        #Written by MaintainTasks just now, complete it the normal way
+        if written is None:
+            return CompleteTask(params)
+
+        if not written:
+            return "Task does not exist"
+
+        return "Task Completed"
+
+    #Task as it was before completing
+    old = response.get('Attributes')
+
+    #Move task to Complete/Late in the daily rollups (only the first time)
+    if old and not old.get('Completed') and old.get('Active'):
+        newStatus = 'Late' if old.get('Late') else 'Complete'
+        ApplyDeltas(MoveChild({}, old, ChildStatus(old), newStatus))
+
+    #Completed again (or inactive): the rollups don't change but a past
+    #   child's exported Completed_By/Completed_On do
+    elif old and dueDate < datetime.now().strftime('%Y%m%d'):
+        BumpVersions(historyNamespace)
 
     return "Task Completed"
 
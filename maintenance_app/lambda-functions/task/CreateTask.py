@@ -1,9 +1,10 @@
 import boto3
 import json
 import uuid
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime
 from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from occurrences import ScheduleThrough, ParentsChanged
 
 # Get the service resource.
 dynamodb = boto3.resource('dynamodb')
@@ -13,23 +14,8 @@ Parent_Table = dynamodb.Table('Parent_Tasks')
 Child_Table = dynamodb.Table('Child_Tasks')
 Machine_Table = dynamodb.Table('Machines')
 
-#Function for Calculating Due Dates for Children
-def CalculateNextDate(start, freq, add):
-
-    #Convert start date to DateTime
-    startDateTime = datetime.strptime(str(start), '%Y%m%d')
-
-    #Add offset for each frequency category
-    if freq == 'Daily':
-        startDateTime += timedelta(days=add)
-    elif freq == 'Weekly':
-        startDateTime += timedelta(weeks=add)
-    elif freq == 'Monthly' :
-        startDateTime += relativedelta(months=add)
-
-    #Return NextDate as String
-    return startDateTime.strftime('%Y%m%d')
-
+#Returns the new Parent_Id, None if the machine doesn't exist or is being
+#   deleted
 def CreateTask(params):
 
     #Parameters
@@ -43,8 +29,32 @@ def CreateTask(params):
 
     #Generate unique parent id
     parentId = str(uuid.uuid4())
-    
+
+    #Due dates of the child instances written now
+    today = datetime.now().strftime('%Y%m%d')
+    dueDates, horizon, refillDate = ScheduleThrough(startDate, frequency, today)
+
+    #Add Parent Task to Machine Tasks List (first, so nothing is written for
+    #   a machine that is gone or being deleted)
+    try:
+        Machine_Table.update_item(
+            Key={
+                'Machine_Id': machineId,
+            },
+            UpdateExpression="ADD Tasks :newTask",
+            ConditionExpression="attribute_exists(Machine_Id) AND attribute_not_exists(Deleting)",
+            ExpressionAttributeValues={
+                ':newTask': {parentId}
+            },
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return None
+
     #Create Parent Task Object
+    #(Horizon is the last child, Refill_Date is when MaintainTasks next
+    #   writes children for it)
     Parent_Table.put_item(
         Item = {
             'Parent_Id' : parentId,
@@ -55,42 +65,36 @@ def CreateTask(params):
             'Active' : 1,
             'Start_Date' : startDate,
             'Completion_Time' : time,
+            'Horizon' : horizon,
+            'Refill_Date' : refillDate,
         }
     )
 
-    #Add Parent Task to Machine Tasks List
-    Machine_Table.update_item(
-        Key={
-            'Machine_Id': machineId,
-        },
-        UpdateExpression="ADD Tasks :newTask",
-        ExpressionAttributeValues={
-            ':newTask': {parentId}
-        },
-    )
-
     #Create Child Instances from Start Date
-    for i in range (0, 10):
-
-        #Calculate Due Date for each child instance
-        nextDue = CalculateNextDate(startDate, frequency, i)
-
-        #Add Child Instance to DB
-        Child_Table.put_item(
-            Item = {
-                'Parent_Id' : parentId,
-                'Due_Date': nextDue,
-                'Due_Time': time,
-                'Machine_Name': machineName,
-                'Frequency': frequency,
-                'Task_Name' : taskName,
-                'Completed' : 0,
-                'Late'  : 0,
-                'Completed_By' : '',
-                'Completed_DateTime': '',
-                'Active' : 1
-            }
-        )
+    #(batch writer sends 25 at a time and retries unprocessed items)
+    with Child_Table.batch_writer() as batch:
+        for nextDue in dueDates:
+
+            #Add Child Instance to Batch
+            batch.put_item(
+                Item = {
+                    'Parent_Id' : parentId,
+                    'Due_Date': nextDue,
+                    'Due_Month': nextDue[:6],
+                    'Due_Time': time,
+                    'Machine_Id': machineId,
+                    'Machine_Name': machineName,
+                    'Frequency': frequency,
+                    'Task_Name' : taskName,
+                    'Completed' : 0,
+                    'Late'  : 0,
+                    'Completed_By' : '',
+                    'Completed_DateTime': '',
+                    'Active' : 1
+                }
+            )
+
+    ParentsChanged()
 
     return parentId
 
@@ -131,6 +135,18 @@ def CreateTaskHandler(event, context):
         #Call function
         result = CreateTask(paramVals)
 
+        #Send User Error if the machine can't take tasks
+        if result is None:
+            return {
+                'statusCode': 400,
+                'headers':{
+                    'Content-Type': 'text/plain'
+                },
+                'body': json.dumps({
+                    'Message' : 'Machine does not exist or is being deleted: ' + paramVals['MachineId']
+                })
+            }
+
         #Send Response
         return {
             'statusCode': 200,
@@ -1,91 +1,52 @@
 import json
 import boto3
 from datetime import datetime
-from boto3.dynamodb.conditions import Key
+from jobs import EnqueueJob
+from occurrences import ParentsChanged
 
 # Get the service resource.
 dynamodb = boto3.resource('dynamodb')
 
 #Get Table Objects
 Parent_Table = dynamodb.Table('Parent_Tasks')
-Child_Table = dynamodb.Table('Child_Tasks')
-Machine_Table = dynamodb.Table('Machines')
 
 #Needs to do the following:
     #Mark Parent As InActive
     #Mark Children As InActive
     #Remove Upcoming Children From DB
     #Remove Task From Machine
+#Only the parent is changed here, the job worker does the rest
 def DeleteTask(params):
     
     #Get Parameters
     parentId = params['ParentId']
 
-    #Mark Parent Inactive
-    Parent_Table.update_item(
+    #Mark Parent Inactive (and get its machine)
+    parent = Parent_Table.update_item(
         Key={
             'Parent_Id': parentId,
         },
         UpdateExpression="SET Active = :zero",
+        ConditionExpression="attribute_exists(Parent_Id)",
         ExpressionAttributeValues={
             ':zero': 0
         },
-    )
+        ReturnValues='ALL_NEW'
+    )['Attributes']
 
-    #Query Children Using GSI
-    children = Child_Table.query(
-        TableName= 'Child_Tasks', 
-        IndexName= "Parent_Index",
-        KeyConditionExpression=
-            Key('Parent_Id').eq(parentId)
-    )['Items']
+    ParentsChanged()
 
-    #Todays DueDate Key
-    today = datetime.now().strftime('%Y%m%d')
+    #Children are handled in the background
+    jobId = EnqueueJob('DeleteTask', {
+        'ParentId': parentId,
+        'Machine_Id': parent['Machine_Id'],
+        'Today': datetime.now().strftime('%Y%m%d')
+    })
 
-    #Mark Children Inactive
-    for child in children:
-
-        #Mark Inactive if passed due
-        if child['Due_Date'] < today:
-            Child_Table.update_item(
-                TableName= 'Child_Tasks', 
-                Key={
-                    'Parent_Id': parentId,
-                    'Due_Date' : child['Due_Date']
-                },
-                UpdateExpression="SET Active = :zero",
-                ExpressionAttributeValues={
-                    ':zero': 0
-                },
-            )
-        #Delete if upcoming
-        else:
-            Child_Table.delete_item(
-                Key = {
-                    'Parent_Id' : parentId,
-                    'Due_Date' : child['Due_Date']
-                }
-            )
-
-    #Get Machine ID of Task
-    machineId = Parent_Table.query(
-        KeyConditionExpression=
-            Key('Parent_Id').eq(parentId)
-    )['Items'][0]['Machine_Id']
-
-    #Remove Task from Machine
-    Machine_Table.update_item(
-        Key={
-            'Machine_Id': machineId,
-        },
-        UpdateExpression = "DELETE Tasks :oldTask",
-        ExpressionAttributeValues={
-            ':oldTask': {parentId}
-        },
-    )
-        
-    return "Successfully deleted task."
+    return {
+        'Message': "Deleting task.",
+        'Job_Id': jobId
+    }
 
 def DeleteTaskHandler(event, context):
     
@@ -123,9 +84,9 @@ def DeleteTaskHandler(event, context):
         #Call function
         result = DeleteTask(paramVals)
 
-        #Send Response
+        #Send Response (children are still being removed)
         return {
-            'statusCode': 200,
+            'statusCode': 202,
             'headers':{
                 'Content-Type': 'text/plain'
             },
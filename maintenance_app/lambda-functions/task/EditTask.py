@@ -1,9 +1,13 @@
 import boto3
 import json
+import os
 import uuid
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+from datetime import datetime
 from boto3.dynamodb.conditions import Key
+from paging import QueryItems
+from occurrences import ScheduleThrough, ParentsChanged
+from cache import GetMachineName
+from jobs import EnqueueJob
 
 # Get the service resource.
 dynamodb = boto3.resource('dynamodb')
@@ -13,22 +17,8 @@ Parent_Table = dynamodb.Table('Parent_Tasks')
 Child_Table = dynamodb.Table('Child_Tasks')
 Machine_Table = dynamodb.Table('Machines')
 
-#Function for Calculating Due Dates for Children
-def CalculateNextDate(start, freq, add):
-
-    #Convert start date to DateTime
-    startDateTime = datetime.strptime(str(start), '%Y%m%d')
-
-    #Add offset for each frequency category
-    if freq == 'Daily':
-        startDateTime += timedelta(days=add)
-    elif freq == 'Weekly':
-        startDateTime += timedelta(weeks=add)
-    elif freq == 'Monthly' :
-        startDateTime += relativedelta(months=add)
-
-    #Return NextDate as Int
-    return startDateTime.strftime('%Y%m%d')
+#Names are copied to children by the PropagateNames stream worker
+propagateAsync = os.environ.get('propagateAsync', '0') == '1'
 
 def updateName(pid, name):
 
@@ -46,27 +36,15 @@ def updateName(pid, name):
         }
     )
 
-    #Grab all Children from Parent
-    children = Child_Table.query(
-        TableName= 'Child_Tasks', 
-        IndexName= "Parent_Index",
-        KeyConditionExpression=
-            Key('Parent_Id').eq(pid)
-    )['Items']
+    #Stream worker will update the children
+    if propagateAsync:
+        return None
 
-    #Update Each Child's Name
-    for child in children:
-        Child_Table.update_item(
-            TableName= 'Child_Tasks', 
-            Key={
-                'Parent_Id': pid,
-                'Due_Date': child['Due_Date']
-            },
-            UpdateExpression="SET Task_Name = :newName",
-            ExpressionAttributeValues={
-                ':newName': name
-            },
-        )
+    #Update Each Child's Name in the background
+    return EnqueueJob('UpdateChildren', {
+        'ParentId': pid,
+        'Updates': {'Task_Name': name}
+    })
 
 def updateMachine(pid, newMid, oldMid):
 
@@ -98,37 +76,24 @@ def updateMachine(pid, newMid, oldMid):
             'Machine_Id': newMid,
         },
         UpdateExpression="ADD Tasks :newTask",
+        ConditionExpression="attribute_exists(Machine_Id) AND attribute_not_exists(Deleting)",
         ExpressionAttributeValues={
             ':newTask': {pid}
         },
     )
 
-    #Grab all Children of Parent
-    children = Child_Table.query(
-        TableName= 'Child_Tasks', 
-        IndexName= "Parent_Index",
-        KeyConditionExpression=
-            Key('Parent_Id').eq(pid)
-    )['Items']
+    #Stream worker will update the children
+    if propagateAsync:
+        return None
 
-    #Grab Machine Name of New Machine
-    machineName = Machine_Table.query(
-        KeyConditionExpression=
-            Key('Machine_Id').eq(newMid)
-    )['Items'][0]['Name']
+    #Grab Machine Name of New Machine (warm cache)
+    machineName = GetMachineName(newMid)
 
-    #Update Each Child's Machine_Name
-    for child in children:
-        Child_Table.update_item(
-            Key={
-                'Parent_Id': pid,
-                'Due_Date': child['Due_Date']
-            },
-            UpdateExpression="SET Machine_Name = :newName",
-            ExpressionAttributeValues={
-                ':newName': machineName
-            },
-        )
+    #Update Each Child's Machine_Id and Machine_Name in the background
+    return EnqueueJob('UpdateChildren', {
+        'ParentId': pid,
+        'Updates': {'Machine_Id': newMid, 'Machine_Name': machineName}
+    })
 
 def updateDescription(pid, desc):
 
@@ -160,13 +125,13 @@ def updateTime(pid, time):
     today = datetime.now().strftime("%Y%m%d")
 
     #Grab all (Future) Children for Parent
-    children = Child_Table.query(
+    children = QueryItems(Child_Table,
         TableName= 'Child_Tasks', 
         IndexName= "Parent_Index",
         KeyConditionExpression=
             Key('Parent_Id').eq(pid) &
             Key('Due_Date').gt(today)
-    )['Items']
+    )
 
     #Update Each Child's Time
     for child in children:
@@ -181,66 +146,39 @@ def updateTime(pid, time):
             },
         )
 
-def updateFrequency(pid, freq, start):
+#template has the Task_Name, Machine_Id, Machine_Name and Due_Time
+#   the new children are written with
+def updateFrequency(pid, freq, start, template):
 
-    #Update Frequency in Parent Table
+    #Due dates of the new child instances
+    today = datetime.now().strftime("%Y%m%d")
+    dueDates, horizon, refillDate = ScheduleThrough(start, freq, today)
+
+    #Update Frequency, Start and Horizon in Parent Table
+    #(MaintainTasks counts later occurrences from Start_Date)
     Parent_Table.update_item(
         Key={
             'Parent_Id': pid,
         },
-        UpdateExpression="SET Frequency = :newFreq",
+        UpdateExpression=
+            "SET Frequency = :newFreq, Start_Date = :start, " +
+            "Horizon = :horizon, Refill_Date = :refill",
         ExpressionAttributeValues={
-            ':newFreq': freq
+            ':newFreq': freq,
+            ':start': start,
+            ':horizon': horizon,
+            ':refill': refillDate
         },
     )
 
-    #Calculate todays date
-    today = datetime.now().strftime("%Y%m%d")
-
-    #Grab future children of Parent - maybe filter by complete
-    children = Child_Table.query(
-        TableName= 'Child_Tasks', 
-        IndexName= "Parent_Index",
-        KeyConditionExpression=
-            Key('Parent_Id').eq(pid) &
-            Key('Due_Date').gte(today),
-        FilterExpression="Completed = :comp",
-        ExpressionAttributeValues= {
-            ':comp' : 0
-        }
-    )['Items']
-
-    #Delete Future Children
-    for child in children:
-        Child_Table.delete_item(
-            Key = {
-                'Parent_Id' : pid,
-                'Due_Date' : child['Due_Date']
-            }
-        )
-
-    #Create Child Instances from new Start Date
-    for i in range (0, 10):
-
-        #Calculate Due Date for each child instance
-        nextDue = CalculateNextDate(start, freq, i)
-
-        #Add Child Instance to DB
-        Child_Table.put_item(
-            Item = {
-                'Parent_Id' : pid,
-                'Due_Date': nextDue,
-                'Due_Time': children[0]['Due_Time'],
-                'Machine_Name': children[0]['Machine_Name'],
-                'Task_Name' : children[0]['Task_Name'],
-                'Frequency': freq,
-                'Completed' : 0,
-                'Late'  : 0,
-                'Completed_By' : '',
-                'Completed_DateTime': '',
-                'Active' : 1
-            }
-        )
+    #Replace future open children in the background
+    return EnqueueJob('UpdateFrequency', {
+        'ParentId': pid,
+        'Today': today,
+        'Frequency': freq,
+        'Due_Dates': dueDates,
+        'Template': template
+    })
 
 def EditTask(params): 
 
@@ -258,8 +196,15 @@ def EditTask(params):
             Key('Parent_Id').eq(parentId)
     )['Items'][0]
     
+    #Tasks can't be moved to (or edited on) a machine that is being deleted
+    if GetMachineName(machineId) is None:
+        return "Failed to edit task: Machine does not exist or is being deleted: " + machineId
+
     msg = ""
 
+    #Background jobs started for the children
+    jobIds = []
+
     #Update Frequency
     if parent['Frequency'] != frequency:
         
@@ -267,18 +212,27 @@ def EditTask(params):
         if 'StartDate' not in params:
             return "Failed to provide parameter: StartDate - Required when Updating Frequency" 
         
-        updateFrequency(parentId, frequency, params['StartDate'])
+        #New children get the edited name, machine and time
+        template = {
+            'Task_Name': taskName,
+            'Machine_Id': machineId,
+            'Machine_Name': GetMachineName(machineId),
+            'Due_Time': completionTime
+        }
+
+        jobIds.append(updateFrequency(parentId, frequency, params['StartDate'],
+                                      template))
         msg += "    - Frequency\n"
 
     #Update Name
     if parent['Name'] != taskName:
-        updateName(parentId, taskName)
+        jobIds.append(updateName(parentId, taskName))
         msg += "    - Task Name\n"
 
     #Update Machine
     if parent['Machine_Id'] != machineId:
         oldMachineId = parent['Machine_Id']
-        updateMachine(parentId, machineId, oldMachineId)
+        jobIds.append(updateMachine(parentId, machineId, oldMachineId))
         msg += "    - Machine\n"
 
     #Update Description
@@ -292,9 +246,15 @@ def EditTask(params):
         msg += "    - Completion Time\n"
 
 
+    #Job ids for the status API
+    jobIds = [jobId for jobId in jobIds if jobId is not None]
+    if len(jobIds) > 0:
+        msg += "Children are updating in jobs: " + ", ".join(jobIds) + "\n"
+
     if msg == "":
         return "No updates made to task."
     else:
+        ParentsChanged()
         return "Update the following: \n" + msg
 
 def EditTaskHandler(event, context):
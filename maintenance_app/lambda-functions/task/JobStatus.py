@@ -0,0 +1,73 @@
+import json
+from jobs import GetJob, JobView, RestartJob
+
+#Get the status and progress of a background job (and a download Url
+#   for finished exports)
+#input: ?JobId=<id>
+#   optional &Restart=true to carry on a Failed job from its last checkpoint
+def JobStatusHandler(event, context):
+
+    #Get Query Params
+    paramVals = event["queryStringParameters"]
+
+    #Return client error if no string params
+    if (paramVals is None or 'JobId' not in paramVals):
+        return{
+            'statusCode': 400,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : 'Failed to provide parameter: JobId'
+            })
+        }
+
+    try:
+        #Call function
+        job = GetJob(paramVals['JobId'])
+
+        #Unknown job
+        if job is None:
+            return {
+                'statusCode': 400,
+                'headers':{
+                    'Content-Type': 'text/plain'
+                },
+                'body': json.dumps({
+                    'Message' : 'Job does not exist'
+                })
+            }
+
+        #Resume a failed job
+        if str(paramVals.get('Restart', '')).lower() in ('1', 'true'):
+            if not RestartJob(job):
+                return {
+                    'statusCode': 400,
+                    'headers':{
+                        'Content-Type': 'text/plain'
+                    },
+                    'body': json.dumps({
+                        'Message' : 'Only failed jobs can be restarted'
+                    })
+                }
+            job = GetJob(paramVals['JobId'])
+
+        #Send Response
+        return {
+            'statusCode': 200,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps(JobView(job))
+        }
+    except Exception as e:
+        #Return exception with response
+        return {
+            'statusCode': 500,
+            'headers':{
+                'Content-Type': 'text/plain'
+            },
+            'body': json.dumps({
+                'Message' : str(e)
+            }) 
+        }
@@ -0,0 +1,9 @@
+from jobs import RunJob
+from cascades import jobSteps
+
+#Runs background jobs enqueued by DeleteTask, EditTask and delete_machine
+#Invoked asynchronously with {"Job_Id": <id>}, re-invokes itself when a
+#job needs more time than one run
+def JobWorkerHandler(event, context):
+
+    return RunJob(event, context, jobSteps)
@@ -1,8 +1,17 @@
 import boto3
-import uuid
-from datetime import datetime, timedelta
-from dateutil.relativedelta import relativedelta
+import json
+import logging
+import os
+import time
+from datetime import datetime
 from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from paging import QueryItems, ScanItems
+from threads import GetThreadTable, ParallelMap
+from rollups import AddDelta, ApplyDeltas
+from schedule import NextOccurrences, horizonSize
+from occurrences import virtualUpcoming, RefillCutoff, ScheduleThrough, ScheduleStart, NewChild, PutIfMissing
+from cache import GetMachineName, ChildrenBackfilled, BumpVersions, childrenNamespace
 
 # Get the service resource.
 dynamodb = boto3.resource('dynamodb')
@@ -11,36 +20,27 @@ dynamodb = boto3.resource('dynamodb')
 Parent_Table = dynamodb.Table('Parent_Tasks')
 Child_Table = dynamodb.Table('Child_Tasks')
 
+#Run metrics and skipped parents go to CloudWatch (level from logLevel)
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('logLevel', 'INFO'))
 
-#Function for Calculating Due Dates for Children
-def CalculateNextDate(start, freq, add):
+#Number of parallel scan segments (and worker threads)
+scanSegments = int(os.environ.get('scanSegments', '8'))
 
-    #Convert start to DateTime
-    nextDate = datetime.strptime(str(start), '%Y%m%d')
+#Refill_Date for parents that can't be topped up, keeps them out of the
+#   Refill_Date scans
+parkedRefill = '99991231'
 
-    #Add offset for each frequency category
-    if freq == 'Daily':
-        nextDate += timedelta(days=add)
-    elif freq == 'Weekly':
-        nextDate += timedelta(weeks=add)
-    elif freq == 'Monthly' :
-        nextDate += relativedelta(months=add)
-
-    #Return NextDate as String
-    return nextDate.strftime('%Y%m%d')
-
-
-#Function that will add child following last child
-def AddChildTask(last, freq):
-
-    #Get Date for newly created task
-    nextDue = CalculateNextDate(last['Due_Date'], freq, 1)
+#Function that will build a child due on nextDue from the last child
+def NextChildTask(last, nextDue, machineId):
 
     #Craft New Task
     newTask = {
         'Parent_Id' : last['Parent_Id'],
         'Due_Date': nextDue,
+        'Due_Month': nextDue[:6],
         'Due_Time': last['Due_Time'],
+        'Machine_Id': machineId,
         'Machine_Name': last['Machine_Name'],
         'Task_Name' : last['Task_Name'],
         'Frequency': last['Frequency'],
@@ -51,11 +51,6 @@ def AddChildTask(last, freq):
         'Active' : 1
     }
 
-    #Add Child Instance to DB
-    Child_Table.put_item(
-        Item = newTask
-    )
-
     return newTask
 
 def MarkLateTasks():
@@ -63,11 +58,15 @@ def MarkLateTasks():
     #Today's Key
     today = datetime.now().strftime('%Y%m%d')
 
-    #Get Today's Incomplete Child Tasks
-    children = Child_Table.query(
+    #Get Today's Incomplete Child Tasks (not already marked)
+    children = QueryItems(Child_Table,
         KeyConditionExpression=Key('Due_Date').eq(today),
-        FilterExpression=Attr('Completed').eq(0)
-    )['Items']
+        FilterExpression=Attr('Completed').eq(0) & Attr('Late').eq(0)
+    )
+
+    #Rollup changes and parent -> machine lookups for this run
+    deltas = {}
+    machineIds = {}
 
     #Mark Each Task Late
     for child in children:
@@ -82,40 +81,350 @@ def MarkLateTasks():
             },
         )
 
-def MaintainTasksHandler(event, context):
+        #Count it as missed until it is completed
+        if child['Active']:
+            AddDelta(deltas, child, 'Missed', 1, machineIds)
 
-    #First Mark Today's Incomplete Task Late
-    MarkLateTasks()
+    #Write counts once per rollup item
+    ApplyDeltas(deltas)
 
-    #Get All Active Parent Tasks
-    parents = Parent_Table.scan(
-        FilterExpression=Attr('Active').eq(1)
-    )['Items']
+#Write the first children of a parent that has none, counted from its
+#   Start_Date (only the ones due after today)
+#Returns (children created, new horizon, new refill date)
+def FirstChildren(pTask, today, batch):
 
-    #Check Each Parent Tasks Children
-    for pTask in parents:
+    start = pTask.get('Start_Date')
 
-        #Calculate todays date
-        today = datetime.now().strftime("%Y%m%d")
+    #Older parents without a Start_Date have nothing to count from
+    if not start:
+        logger.warning(json.dumps({'Parent_Id': pTask['Parent_Id'],
+                                   'Error': 'No children or Start_Date, parked'}))
+        return 0, pTask.get('Horizon'), parkedRefill
 
-        #Grab future children of Parent
-        children = Child_Table.query(
-            TableName= 'Child_Tasks', 
+    machineName = GetMachineName(pTask['Machine_Id']) or ''
+    dueDates = NextOccurrences(str(start), pTask['Frequency'], horizonSize, today)
+
+    for nextDue in dueDates:
+        batch.put_item(Item = NewChild(pTask, nextDue, machineName))
+
+    return len(dueDates), dueDates[-1], dueDates[0]
+
+#Top up one parent to horizonSize future children
+#Returns (children created, new horizon, new refill date)
+def TopUpParent(pTask, today, batch):
+
+    childTable = GetThreadTable('Child_Tasks')
+
+    #Grab future children of Parent (sorted by due date)
+    children = list(QueryItems(childTable,
+        IndexName= "Parent_Index",
+        KeyConditionExpression=
+            Key('Parent_Id').eq(pTask['Parent_Id']) &
+            Key('Due_Date').gt(today)
+    ))
+
+    #No future children - continue from the latest past child
+    if len(children) == 0:
+        children = childTable.query(
             IndexName= "Parent_Index",
-            KeyConditionExpression=
-                Key('Parent_Id').eq(pTask['Parent_Id']) &
-                Key('Due_Date').gt(today)
+            KeyConditionExpression=Key('Parent_Id').eq(pTask['Parent_Id']),
+            ScanIndexForward=False,
+            Limit=1
         )['Items']
 
+        #Nothing to copy from
+        if len(children) == 0:
+            return FirstChildren(pTask, today, batch)
+
+    created = 0
+    last = children[-1]
+    futureDates = [c['Due_Date'] for c in children if c['Due_Date'] > today]
+
+    #Occurrences are counted from the task's start (from the last child for
+    #   older tasks, or ones whose Start_Date is out of step with it) and
+    #   only the missing ones after today are built
+    anchor = ScheduleStart(pTask, last['Due_Date'])
+    after = max(last['Due_Date'], today)
+    needed = horizonSize - len(futureDates)
+
+    if needed > 0:
+        for nextDue in NextOccurrences(anchor, pTask['Frequency'], needed, after):
+            batch.put_item(Item = NextChildTask(last, nextDue, pTask['Machine_Id']))
+            futureDates.append(nextDue)
+            created += 1
+
+    #Too few remain once the horizonSize-th from last child is due
+    return created, futureDates[-1], futureDates[-horizonSize]
+
+#Write a parent's children due through tomorrow (virtualUpcoming mode)
+#   Children for days already gone (runs MaintainTasks missed) are written
+#   late and counted as missed in deltas
+#Returns (children created, new horizon, new refill date)
+def MaterializeParent(pTask, today, deltas):
+
+    childTable = GetThreadTable('Child_Tasks')
+    created = 0
+
+    dueDates, horizon, refillDate = ScheduleThrough(ScheduleStart(pTask),
+        pTask['Frequency'], today, pTask.get('Horizon'))
+
+    #Children completed early already exist and are left alone
+    for dueDate in dueDates:
+        child = NewChild(pTask, dueDate, GetMachineName(pTask['Machine_Id']) or '')
+
+        #MarkLateTasks has already been through today's children
+        if dueDate <= today:
+            child['Late'] = 1
+
+        if PutIfMissing(childTable, child):
+            created += 1
+            if child['Late']:
+                AddDelta(deltas, child, 'Missed', 1)
+
+    return created, horizon, refillDate
+
+#Store where the parent's children end and when it next needs a top up
+def SaveHorizon(parentId, horizon, refillDate):
+
+    GetThreadTable('Parent_Tasks').update_item(
+        Key={
+            'Parent_Id': parentId,
+        },
+        UpdateExpression="SET Horizon = :horizon, Refill_Date = :refill",
+        ExpressionAttributeValues={
+            ':horizon': horizon,
+            ':refill': refillDate
+        },
+    )
+
+#Top up a group of parents, returns (parents checked, children created)
+def TopUpParents(parents, today):
+
+    checked = 0
+    created = 0
+    horizons = []
+    deltas = {}
+
+    #New children for this group go through one batch writer
+    with GetThreadTable('Child_Tasks').batch_writer() as batch:
+
+        #Check Each Parent Tasks Children
+        for pTask in parents:
+
+            #A bad frequency shouldn't stop the rest of the group
+            try:
+                if virtualUpcoming:
+                    count, horizon, refillDate = MaterializeParent(pTask, today, deltas)
+                else:
+                    count, horizon, refillDate = TopUpParent(pTask, today, batch)
+            except ValueError as e:
+                logger.warning(json.dumps({'Parent_Id': pTask['Parent_Id'], 'Error': str(e)}))
+                count, refillDate = 0, None
+
+            if refillDate is not None:
+                horizons.append((pTask['Parent_Id'], horizon, refillDate))
+
+            created += count
+            checked += 1
+
+    #Count late children written for missed days
+    ApplyDeltas(deltas, GetThreadTable('Task_Rollups'))
+
+    #Only move the markers once the children are written
+    for parentId, horizon, refillDate in horizons:
+        SaveHorizon(parentId, horizon, refillDate)
+
+    return checked, created
+
+#Top up a chunk of parents that came from Refill_Index
+def MaintainChunk(job):
+
+    parents, today = job
+
+    return TopUpParents(parents, today)
 
-        #If Less than 10 child tasks remaining
-        while len(children) < 10:
+#Scan one segment for active parents that don't have markers yet
+def BackfillSegment(job):
 
-            #Sort children by due date
-            sortedChildren = sorted(children, key=lambda c: c['Due_Date']) 
+    segment, totalSegments, today = job
+
+    #Get Active Parent Tasks without a horizon in this segment
+    parents = ScanItems(GetThreadTable('Parent_Tasks'),
+        FilterExpression=
+            Attr('Active').eq(1) & Attr('Refill_Date').not_exists(),
+        Segment=segment,
+        TotalSegments=totalSegments
+    )
+
+    return TopUpParents(parents, today)
+
+#Scan one segment for active parents that need children, for tables
+#   where Refill_Index can't be read yet (parents without markers count)
+def RefillSegment(job):
+
+    segment, totalSegments, today = job
+
+    parents = ScanItems(GetThreadTable('Parent_Tasks'),
+        FilterExpression=
+            Attr('Active').eq(1) &
+            (Attr('Refill_Date').not_exists() |
+             Attr('Refill_Date').lte(RefillCutoff(today))),
+        Segment=segment,
+        TotalSegments=totalSegments
+    )
+
+    return TopUpParents(parents, today)
+
+#Add Machine_Id/Due_Month to one segment's older children
+def BackfillChildrenSegment(job):
+
+    segment, totalSegments, today = job
+    checked = 0
+    updated = 0
+    childTable = GetThreadTable('Child_Tasks')
+
+    #Get every Parent Task in this segment
+    parents = ScanItems(GetThreadTable('Parent_Tasks'),
+        ProjectionExpression='Parent_Id, Machine_Id',
+        Segment=segment,
+        TotalSegments=totalSegments
+    )
+
+    for pTask in parents:
+
+        #Children written before these attributes existed
+        children = QueryItems(childTable,
+            IndexName= "Parent_Index",
+            KeyConditionExpression=Key('Parent_Id').eq(pTask['Parent_Id']),
+            FilterExpression=
+                Attr('Machine_Id').not_exists() | Attr('Due_Month').not_exists(),
+            ProjectionExpression='Parent_Id, Due_Date'
+        )
+
+        for child in children:
+            childTable.update_item(
+                Key={
+                    'Parent_Id': child['Parent_Id'],
+                    'Due_Date': child['Due_Date']
+                },
+                UpdateExpression="SET Machine_Id = :mid, Due_Month = :month",
+                ExpressionAttributeValues={
+                    ':mid': pTask['Machine_Id'],
+                    ':month': child['Due_Date'][:6]
+                },
+            )
+            updated += 1
+
+        checked += 1
+
+    return checked, updated
+
+#Add Machine_Id/Due_Month to old children on every run until a run finds
+#none left, then mark them done so the views switch to Machine_Index and
+#Due_Month_Index. Returns the children updated
+def BackfillChildrenRollout(today):
+
+    jobs = [(segment, scanSegments, today) for segment in range(0, scanSegments)]
+    updated = sum(r[1] for r in ParallelMap(BackfillChildrenSegment, jobs, workers=scanSegments))
+
+    if updated == 0:
+        BumpVersions(childrenNamespace)
+
+    return updated
+
+#Only parents whose Refill_Date has arrived are touched. Until old
+#children have been backfilled each run also gives them Machine_Id and
+#Due_Month (see BackfillChildrenRollout). One off runs for data written
+#by older versions:
+#   {"Backfill": true} tops up active parents that have no Refill_Date
+#   {"BackfillChildren": true} adds Machine_Id/Due_Month to old children
+#{"Segment": n, "TotalSegments": m} splits either scan across several
+#invocations.
+def MaintainTasksHandler(event, context):
+
+    startTime = time.time()
+    event = event or {}
+
+    #Pick the backfill to run, if any
+    if event.get('BackfillChildren'):
+        backfill = BackfillChildrenSegment
+    elif event.get('Backfill'):
+        backfill = BackfillSegment
+    else:
+        backfill = None
+
+    #First Mark Today's Incomplete Task Late
+    if backfill is None:
+        MarkLateTasks()
+
+    #Calculate todays date
+    today = datetime.now().strftime("%Y%m%d")
+
+    if backfill is not None:
+
+        #Pick the segments this invocation owns
+        if 'TotalSegments' in event:
+            totalSegments = int(event['TotalSegments'])
+            segments = [int(event['Segment'])]
+        else:
+            totalSegments = scanSegments
+            segments = range(0, scanSegments)
+
+        #Each segment is scanned and backfilled on its own thread
+        jobs = [(segment, totalSegments, today) for segment in segments]
+        results = ParallelMap(backfill, jobs, workers=scanSegments)
+
+    else:
+
+        #Get Active Parents that are running low on children
+        #   (or, with virtualUpcoming, have a child due by tomorrow)
+        try:
+            parents = list(QueryItems(Parent_Table,
+                IndexName='Refill_Index',
+                KeyConditionExpression=
+                    Key('Active').eq(1) &
+                    Key('Refill_Date').lte(RefillCutoff(today))
+            ))
+        except ClientError as e:
+            #Index not created (or still building) on this table
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
+            parents = None
+
+        if parents is not None:
+
+            #Split them evenly over the worker threads
+            size = max(1, -(-len(parents) // scanSegments))
+            jobs = [(parents[i:i + size], today)
+                        for i in range(0, len(parents), size)]
+            results = ParallelMap(MaintainChunk, jobs, workers=scanSegments)
+
+        else:
+
+            #Fallback - Scan for them in parallel segments
+            jobs = [(segment, scanSegments, today) for segment in range(0, scanSegments)]
+            results = ParallelMap(RefillSegment, jobs, workers=scanSegments)
+
+    #Children written by older versions still need backfilling
+    childrenBackfilled = None
+    if backfill is None and not ChildrenBackfilled():
+        childrenBackfilled = BackfillChildrenRollout(today)
+
+    #Throughput Metrics
+    elapsed = time.time() - startTime
+    checked = sum(r[0] for r in results)
+    metrics = {
+        'Backfill': backfill.__name__ if backfill else None,
+        'RefillIndex': backfill is None and parents is not None,
+        'ChildrenBackfilled': childrenBackfilled,
+        'Workers': len(jobs),
+        'ParentsChecked': checked,
+        'ChildrenWritten': sum(r[1] for r in results),
+        'Seconds': round(elapsed, 3),
+        'ParentsPerSecond': round(checked / max(elapsed, 0.001), 1)
+    }
 
-            #Add another child after last child
-            newChild = AddChildTask(children[-1], pTask['Frequency'])
+    #Log for CloudWatch
+    logger.info(json.dumps(metrics))
 
-            #Append to children list
-            children.append(newChild)
+    return metrics
@@ -0,0 +1,78 @@
+import json
+import logging
+import os
+from boto3.dynamodb.types import TypeDeserializer
+from fanout import UpdateChildren
+from cache import GetMachineName
+
+#Logger for CloudWatch
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('logLevel', 'INFO'))
+
+#Converts stream images to plain python values
+deserializer = TypeDeserializer()
+
+#Convert a stream image into a normal item
+def ReadImage(record, name):
+
+    image = record['dynamodb'].get(name, {})
+
+    return {key: deserializer.deserialize(value) for key, value in image.items()}
+
+#Parent renamed or moved to another machine
+def ParentChanged(old, new):
+
+    updated = 0
+    pid = new['Parent_Id']
+
+    #Copy the new task name to the children
+    if old.get('Name') != new.get('Name'):
+        updated += UpdateChildren(pid, 'Task_Name', new['Name'])
+
+    #Copy the new machine to the children
+    if old.get('Machine_Id') != new.get('Machine_Id'):
+        updated += UpdateChildren(pid, 'Machine_Id', new['Machine_Id'])
+        machineName = GetMachineName(new['Machine_Id'])
+
+        if machineName is not None:
+            updated += UpdateChildren(pid, 'Machine_Name', machineName)
+
+    return updated
+
+#Machine renamed
+def MachineChanged(old, new):
+
+    updated = 0
+
+    #Copy the new machine name to the children of every task
+    if old.get('Name') != new.get('Name'):
+        for pid in new.get('Tasks', []):
+            updated += UpdateChildren(pid, 'Machine_Name', new['Name'])
+
+    return updated
+
+#Consumes the Parent_Tasks and Machines streams and copies names onto
+#   child instances, so the edit APIs only write the parent or machine
+def PropagateNamesHandler(event, context):
+
+    updated = 0
+
+    for record in event['Records']:
+
+        #Only edits can rename
+        if record['eventName'] != 'MODIFY':
+            continue
+
+        old = ReadImage(record, 'OldImage')
+        new = ReadImage(record, 'NewImage')
+
+        #Which table the change came from
+        if '/Parent_Tasks/' in record['eventSourceARN']:
+            updated += ParentChanged(old, new)
+        elif '/Machines/' in record['eventSourceARN']:
+            updated += MachineChanged(old, new)
+
+    #Log for CloudWatch
+    logger.info(json.dumps({'Records': len(event['Records']), 'ChildrenUpdated': updated}))
+
+    return updated
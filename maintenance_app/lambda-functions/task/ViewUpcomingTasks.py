@@ -1,14 +1,138 @@
 import boto3
 import json
+import os
 from datetime import datetime, timedelta
 from boto3.dynamodb.conditions import Key
 from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from paging import QueryItems
+from threads import GetThreadTable, ParallelMap, ParallelScan
+from cache import ChildrenBackfilled, GetCached, parentsNamespace
+from occurrences import virtualUpcoming, VirtualChildren, MergeUpcoming
 
 #Get the service resource.
 dynamodb = boto3.resource('dynamodb')
 
 #Table Object
 Child_Table = dynamodb.Table('Child_Tasks')
+Parent_Table = dynamodb.Table('Parent_Tasks')
+
+#Use Month Buckets before MaintainTasks has marked old children as having
+#   Due_Month (see the stack's useMonthIndex), they're used after that anyway
+useMonthIndex = os.environ.get('useMonthIndex', '0') == '1'
+
+#Parallel scan segments when Refill_Index can't be read
+scanSegments = int(os.environ.get('scanSegments', '4'))
+
+#Parent fields VirtualChildren needs
+parentFields = {
+    'ProjectionExpression': 'Parent_Id, Machine_Id, #N, Frequency, Start_Date, ' +
+                            'Horizon, Completion_Time, Active',
+    'ExpressionAttributeNames': {'#N': 'Name'}
+}
+
+#Remove Decimal Fields
+def CleanChildren(children):
+
+    for child in children:
+        del child['Active']
+        del child['Completed']
+        del child['Late']
+
+    return children
+
+#Written children to return (virtual mode needs completed ones too,
+#   so it knows which dates are already covered)
+def UpcomingFilter():
+
+    if virtualUpcoming:
+        return Attr('Active').eq(1)
+
+    return Attr('Active').eq(1)&Attr('Completed').eq(0)
+
+#Get 'YYYYMM' month buckets covering start through end
+def MonthsBetween(start, end):
+
+    months = []
+    year, month = start.year, start.month
+
+    while (year, month) <= (end.year, end.month):
+        months.append('%04d%02d' % (year, month))
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+
+    return months
+
+#One Range Query per Month Bucket
+def QueryByMonth(start, end):
+
+    tasks = []
+    first = start.strftime('%Y%m%d')
+    last = end.strftime('%Y%m%d')
+
+    for month in MonthsBetween(start, end):
+
+        #Get incomplete tasks due this month within range
+        children = QueryItems(Child_Table,
+            IndexName='Due_Month_Index',
+            KeyConditionExpression=
+                Key('Due_Month').eq(month) &
+                Key('Due_Date').between(first, last),
+            FilterExpression=UpcomingFilter()
+        )
+
+        tasks.extend(children)
+
+    return tasks
+
+#Get incomplete tasks due on a single day
+def QueryDay(dueDate):
+
+    return list(QueryItems(GetThreadTable('Child_Tasks'),
+        KeyConditionExpression=Key('Due_Date').eq(dueDate),
+        FilterExpression=UpcomingFilter()
+    ))
+
+#Fallback - Query each day in parallel
+def QueryByDay(start, days):
+
+    tasks = []
+
+    #Calculate key for each due date
+    dueDates = [(start + timedelta(days=addDay)).strftime('%Y%m%d')
+                    for addDay in range(0, days + 1)]
+
+    #Run day queries concurrently, results come back in date order
+    for children in ParallelMap(QueryDay, dueDates):
+        tasks.extend(children)
+
+    return tasks
+
+#Load every active parent (key is unused, see GetActiveParents)
+def LoadActiveParents(key):
+
+    try:
+        return list(QueryItems(Parent_Table,
+            IndexName='Refill_Index',
+            KeyConditionExpression=Key('Active').eq(1),
+            **parentFields
+        ))
+    except ClientError as e:
+        #Index not created on this table yet
+        if e.response['Error']['Code'] != 'ValidationException':
+            raise
+
+    #Fallback - Scan in parallel segments
+    return ParallelScan('Parent_Tasks', scanSegments,
+        FilterExpression=Attr('Active').eq(1),
+        **parentFields
+    )
+
+#Every active parent, from the warm cache while no parent has changed
+def GetActiveParents():
+
+    return GetCached(parentsNamespace, 'ACTIVE', LoadActiveParents)
 
 #Needs to do the following
     #Grab upcoming task in child db (use DueDate)
@@ -17,31 +141,31 @@ def ViewUpcomingTasks(params):
 
     #Parameters
     daysForward = int(params['DaysForward'])
-    
-    tasks = []
 
-    #Iterate from today to 'N' days forward
-    for addDay in range(0, daysForward + 1):
+    #Date Range
+    today = datetime.now()
+    future = today + timedelta(days=daysForward)
 
-        #Calculate key for due date
-        dueDate = (datetime.now()+timedelta(days=addDay)).strftime('%Y%m%d')
-        
-        #Get incomplete tasks due
-        children = Child_Table.query(
-            KeyConditionExpression=Key('Due_Date').eq(dueDate),
-            FilterExpression=Attr('Active').eq(1)&Attr('Completed').eq(0)
-        )['Items']
+    tasks = None
 
-        #Remove Decimal Fields
-        for child in children:
-            del child['Active']
-            del child['Completed']
-            del child['Late']
+    if useMonthIndex or ChildrenBackfilled():
+        try:
+            tasks = QueryByMonth(today, future)
+        except ClientError as e:
+            #Index not created on this table yet
+            if e.response['Error']['Code'] != 'ValidationException':
+                raise
 
-        #Append Task to List
-        tasks = tasks + children
+    if tasks is None:
+        tasks = QueryByDay(today, daysForward)
 
-    return tasks
+    #Add future occurrences that haven't been written
+    if virtualUpcoming:
+        virtual = VirtualChildren(GetActiveParents(),
+            today.strftime('%Y%m%d'), future.strftime('%Y%m%d'))
+        tasks = MergeUpcoming(tasks, virtual)
+
+    return CleanChildren(tasks)
 
 def ViewUpcomingTasksHandler(event, context):
     
@@ -0,0 +1,71 @@
+#Shared helper for reading many items by key with BatchGetItem.
+#Keys are split into calls of 100 (the BatchGetItem limit), the calls
+#run on the thread pool, and unprocessed keys are retried with backoff
+#(up to maxAttempts calls per chunk).
+import time
+from threads import GetThreadResource, ParallelMap
+
+#Most keys BatchGetItem accepts in one call
+batchSize = 100
+
+#Most calls made for one chunk before giving up on its unprocessed keys
+maxAttempts = 8
+
+#Get one chunk of keys, job is (tableName, keys, extra request args)
+def BatchGetChunk(job):
+
+    tableName, keys, options = job
+    resource = GetThreadResource()
+
+    items = []
+    delay = 0.05
+    attempts = 0
+    request = {tableName: dict(options, Keys=keys)}
+
+    while request:
+        response = resource.batch_get_item(RequestItems=request)
+        items.extend(response['Responses'].get(tableName, []))
+        attempts += 1
+
+        #Retry anything DynamoDB didn't get to (throttling etc.)
+        request = response.get('UnprocessedKeys') or {}
+        if request:
+            if attempts >= maxAttempts:
+                raise RuntimeError(str(len(request[tableName]['Keys'])) +
+                    ' keys of ' + tableName + ' still unprocessed after ' +
+                    str(attempts) + ' attempts')
+
+            time.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    return items
+
+#Get every item for a list of keys (order isn't kept, missing keys are
+#   left out). projection/names work the same as they do for query.
+def BatchGet(tableName, keys, projection=None, names=None, workers=None):
+
+    #BatchGetItem rejects duplicate keys
+    unique = []
+    seen = set()
+    for key in keys:
+        marker = tuple(sorted(key.items()))
+        if marker not in seen:
+            seen.add(marker)
+            unique.append(key)
+
+    #Extra request arguments
+    options = {}
+    if projection is not None:
+        options['ProjectionExpression'] = projection
+    if names is not None:
+        options['ExpressionAttributeNames'] = names
+
+    #Split into calls of 100 keys and run them concurrently
+    jobs = [(tableName, unique[i:i + batchSize], options)
+                for i in range(0, len(unique), batchSize)]
+
+    items = []
+    for chunk in ParallelMap(BatchGetChunk, jobs, workers=workers):
+        items.extend(chunk)
+
+    return items
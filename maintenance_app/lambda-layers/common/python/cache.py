@@ -0,0 +1,206 @@
+#In-process cache for records that rarely change: machine names and the
+#machine type lists (not Tasks sets, every task create/delete edits those).
+#It lives at module level, so warm Lambda containers keep it between
+#invocations. Each namespace has a version stamp in the Cache_Versions
+#table; writers bump the stamp and readers drop their copy when the
+#stamp they see changes. Entries also expire after cacheTtl seconds and
+#the least recently used ones are dropped past maxEntries. Lookups are
+#safe from worker threads (tables come from threads.GetThreadTable).
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from paging import ScanItems
+from batching import BatchGet
+from threads import GetThreadTable
+
+#Namespaces (bumped by the machine and machine type APIs)
+machinesNamespace = 'Machines'
+typesNamespace = 'Machine_Types'
+
+#Stamp only (nothing cached here), bumped when a past child changes so
+#cached history exports are rebuilt
+historyNamespace = 'History'
+
+#Active parents as the virtual upcoming views read them, bumped when a
+#parent is created, edited or deactivated
+parentsNamespace = 'Parents'
+
+#Stamp only, set by MaintainTasks once every child has Machine_Id and
+#Due_Month, Machine_Index and Due_Month_Index are only read after that
+childrenNamespace = 'Children_Backfilled'
+
+#Seconds a cached record is trusted
+cacheTtl = float(os.environ.get('cacheTtl', '300'))
+
+#Seconds between reads of a namespace's version stamp
+stampTtl = float(os.environ.get('cacheStampTtl', '5'))
+
+#Most records kept per namespace
+maxEntries = int(os.environ.get('cacheMaxEntries', '1024'))
+
+#namespace -> {'Version', 'Checked', 'Entries': key -> (expires, value)}
+caches = {}
+cacheLock = threading.Lock()
+
+#Read a namespace's version stamp
+def GetVersion(namespace):
+
+    item = GetThreadTable('Cache_Versions').get_item(
+        Key={'Name': namespace}
+    ).get('Item', {})
+
+    return int(item.get('Version', 0))
+
+#Mark namespaces as changed so every container reloads them
+def BumpVersions(*namespaces):
+
+    for namespace in namespaces:
+        GetThreadTable('Cache_Versions').update_item(
+            Key={'Name': namespace},
+            UpdateExpression="ADD Version :one",
+            ExpressionAttributeValues={':one': 1}
+        )
+
+        #Don't serve old copies from this container either
+        with cacheLock:
+            caches.pop(namespace, None)
+
+#Get a namespace's entries, clearing them if its stamp changed
+def GetEntries(namespace):
+
+    now = time.time()
+
+    with cacheLock:
+        cache = caches.get(namespace)
+        if cache is not None and now - cache['Checked'] < stampTtl:
+            return cache['Entries']
+
+    #Stamp is due for a check (done outside the lock)
+    version = GetVersion(namespace)
+
+    with cacheLock:
+        cache = caches.get(namespace)
+
+        if cache is None or cache['Version'] != version:
+            cache = {'Version': version, 'Entries': OrderedDict()}
+            caches[namespace] = cache
+
+        cache['Checked'] = now
+        return cache['Entries']
+
+#True once the children backfill has finished (see childrenNamespace)
+def ChildrenBackfilled():
+
+    GetEntries(childrenNamespace)
+
+    with cacheLock:
+        return caches.get(childrenNamespace, {}).get('Version', 0) > 0
+
+#Look up a key, returns (found, value)
+def ReadEntry(entries, key):
+
+    with cacheLock:
+        entry = entries.get(key)
+
+        if entry is None or entry[0] < time.time():
+            return False, None
+
+        entries.move_to_end(key)
+        return True, copy.deepcopy(entry[1])
+
+#Store a value, dropping the least recently used entries
+def WriteEntry(entries, key, value):
+
+    with cacheLock:
+        entries[key] = (time.time() + cacheTtl, copy.deepcopy(value))
+        entries.move_to_end(key)
+
+        while len(entries) > maxEntries:
+            entries.popitem(last=False)
+
+#Get one value, loader(key) is called on a miss (None isn't cached)
+def GetCached(namespace, key, loader):
+
+    entries = GetEntries(namespace)
+    found, value = ReadEntry(entries, key)
+
+    if found:
+        return value
+
+    value = loader(key)
+
+    if value is not None:
+        WriteEntry(entries, key, value)
+
+    return value
+
+#Get many values, loader(keys) returns {key: value} for the misses
+def GetManyCached(namespace, keys, loader):
+
+    entries = GetEntries(namespace)
+    values = {}
+    missing = []
+
+    for key in keys:
+        found, value = ReadEntry(entries, key)
+        if found:
+            values[key] = value
+        else:
+            missing.append(key)
+
+    #Load all misses at once
+    if len(missing) > 0:
+        for key, value in loader(missing).items():
+            WriteEntry(entries, key, value)
+            values[key] = value
+
+    return values
+
+#Load Machine_Id -> Name for a list of machine ids
+#   Machines being deleted are left out, as if they were already gone
+def LoadMachineNames(ids):
+
+    machines = BatchGet('Machines',
+        [{'Machine_Id': mid} for mid in ids],
+        projection='Machine_Id, #N, Deleting',
+        names={'#N': 'Name'}
+    )
+
+    return {m['Machine_Id']: m['Name'] for m in machines if 'Deleting' not in m}
+
+#Get {Machine_Id: Name} for many machines (missing machines and machines
+#   being deleted are left out)
+def GetMachineNames(ids):
+
+    return GetManyCached(machinesNamespace, list(set(ids)), LoadMachineNames)
+
+#Get one machine's name, None if it doesn't exist (or is being deleted)
+def GetMachineName(machineId):
+
+    return GetMachineNames([machineId]).get(machineId)
+
+#Load every machine type, Machines sets become sorted lists
+def LoadMachineTypes(key):
+
+    types = list(ScanItems(GetThreadTable('Machine_Types')))
+
+    for item in types:
+        item['Machines'] = sorted(item.get('Machines', []))
+
+    return types
+
+#Get every machine type
+def GetMachineTypes():
+
+    return GetCached(typesNamespace, 'ALL', LoadMachineTypes)
+
+#Get the machine ids of one type, None if the type doesn't exist
+def GetMachineIdsByType(machineType):
+
+    for item in GetMachineTypes():
+        if item['Machine_Type'] == machineType:
+            return item['Machines']
+
+    return None
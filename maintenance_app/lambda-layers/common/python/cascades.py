@@ -0,0 +1,332 @@
+#Step functions for the background jobs that change many child instances
+#(see jobs.py). Each step handles one page of children (or one round of
+#parents) so a job can stop between steps and be resumed from its cursor.
+#Every step is safe to repeat: deleted children are gone, deactivated
+#children are skipped and rollups only count children that were active.
+import logging
+import os
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from rollups import ChildStatus, AddDelta, ApplyDeltas
+from threads import GetThreadTable, GetThreadResource, ParallelMap, maxWorkers
+from fanout import UpdateChild
+from cache import BumpVersions, historyNamespace
+from jobs import AddProgress
+from occurrences import ParentsChanged
+
+#Logger for CloudWatch
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('logLevel', 'INFO'))
+
+#Query one page of a parent's children, returns (items, cursor)
+#cursor is None once the last page has been read
+def ChildPage(pid, cursor, since=None, **kwargs):
+
+    if cursor is not None:
+        kwargs['ExclusiveStartKey'] = cursor
+
+    keyCondition = Key('Parent_Id').eq(pid)
+
+    #Only children due on or after since
+    if since is not None:
+        keyCondition = keyCondition & Key('Due_Date').gte(since)
+
+    response = GetThreadTable('Child_Tasks').query(
+        IndexName= "Parent_Index",
+        KeyConditionExpression=keyCondition,
+        **kwargs
+    )
+
+    return response['Items'], response.get('LastEvaluatedKey')
+
+#Delete upcoming children and deactivate past ones on a page
+#Returns (deleted, deactivated)
+def RetireChildren(children, today, machineIds):
+
+    childTable = GetThreadTable('Child_Tasks')
+    deleted = 0
+    deactivated = 0
+
+    #Rollup changes for children leaving history
+    deltas = {}
+
+    #Upcoming children are deleted in batches of 25
+    with childTable.batch_writer() as batch:
+
+        for child in children:
+
+            #Delete if upcoming
+            if child['Due_Date'] >= today:
+                batch.delete_item(
+                    Key = {
+                        'Parent_Id' : child['Parent_Id'],
+                        'Due_Date' : child['Due_Date']
+                    }
+                )
+                deleted += 1
+
+            #Mark Inactive if passed due (skip ones a past run handled)
+            elif child['Active']:
+
+                #Inactive children are no longer counted
+                AddDelta(deltas, child, ChildStatus(child), -1, machineIds)
+
+                childTable.update_item(
+                    Key={
+                        'Parent_Id': child['Parent_Id'],
+                        'Due_Date' : child['Due_Date']
+                    },
+                    UpdateExpression="SET Active = :zero",
+                    ExpressionAttributeValues={
+                        ':zero': 0
+                    },
+                )
+                deactivated += 1
+
+    #Update Daily Rollups
+    ApplyDeltas(deltas, GetThreadTable('Task_Rollups'))
+
+    return deleted, deactivated
+
+#Take a task off a machine's Tasks set
+def RemoveTaskFromMachine(pid, machineId):
+
+    GetThreadTable('Machines').update_item(
+        Key={
+            'Machine_Id': machineId
+        },
+        UpdateExpression="DELETE Tasks :pid",
+        ExpressionAttributeValues={
+            ':pid': {pid}
+        },
+    )
+
+#Retire every child of one parent then take it off the machine
+#job: (parentId, machineId, today), returns (deleted, deactivated)
+def CascadeParent(job):
+
+    pid, machineId, today = job
+    deleted = 0
+    deactivated = 0
+    cursor = None
+
+    #mark parent task as inactive
+    GetThreadTable('Parent_Tasks').update_item(
+        Key={
+            'Parent_Id': pid
+        },
+        UpdateExpression="SET Active = :inactive",
+        ExpressionAttributeValues={
+            ':inactive': 0
+        },
+    )
+
+    while True:
+        children, cursor = ChildPage(pid, cursor)
+        counts = RetireChildren(children, today, {pid: machineId})
+        deleted += counts[0]
+        deactivated += counts[1]
+
+        if cursor is None:
+            break
+
+    #Parent is done, a rerun of the machine job skips it
+    RemoveTaskFromMachine(pid, machineId)
+
+    return deleted, deactivated
+
+#True if a RemoveMachine transaction was cancelled only because the
+#   machine type doesn't exist (its Update is the second item)
+def TypeMissing(error):
+
+    if error.response['Error']['Code'] != 'TransactionCanceledException':
+        return False
+
+    codes = [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+
+    return (len(codes) == 2 and codes[1] == 'ConditionalCheckFailed' and
+            codes[0] in ('None', None))
+
+#Delete a machine and its type membership together
+def RemoveMachine(machineId, machineType):
+
+    try:
+        GetThreadResource().meta.client.transact_write_items(
+            TransactItems=[
+                {
+                    'Delete': {
+                        'TableName': 'Machines',
+                        'Key': {'Machine_Id': machineId}
+                    }
+                },
+                {
+                    'Update': {
+                        'TableName': 'Machine_Types',
+                        'Key': {'Machine_Type': machineType},
+                        'UpdateExpression': "DELETE Machines :id",
+                        'ConditionExpression': "attribute_exists(Machine_Type)",
+                        'ExpressionAttributeValues': {':id': {machineId}}
+                    }
+                }
+            ]
+        )
+    except ClientError as e:
+
+        #Anything other than a missing machine type is a real failure
+        if not TypeMissing(e):
+            raise
+
+        logger.warning("Machine type " + machineType + " does not exist, deleting machine only.")
+
+        GetThreadTable('Machines').delete_item(
+            Key={
+                'Machine_Id': machineId
+            }
+        )
+
+#DeleteTask job
+#Params: ParentId, Machine_Id, Today
+def DeleteTaskStep(job):
+
+    params = job['Params']
+    pid = params['ParentId']
+
+    children, job['Cursor'] = ChildPage(pid, job['Cursor'])
+    deleted, deactivated = RetireChildren(children, params['Today'],
+                                          {pid: params['Machine_Id']})
+    AddProgress(job, ChildrenDeleted=deleted, ChildrenDeactivated=deactivated)
+
+    #More children to go
+    if job['Cursor'] is not None:
+        return False
+
+    RemoveTaskFromMachine(pid, params['Machine_Id'])
+    return True
+
+#DeleteMachine job, one round of parents per step
+#Params: Machine_Id, Machine_Type, Today
+def DeleteMachineStep(job):
+
+    params = job['Params']
+    machineId = params['Machine_Id']
+
+    #Parents are removed from Tasks as they finish, so this is what's left
+    machine = GetThreadTable('Machines').get_item(
+        Key={'Machine_Id': machineId},
+        ProjectionExpression='Tasks'
+    ).get('Item')
+
+    #Already removed by an earlier run
+    if machine is None:
+        return True
+
+    parents = sorted(machine.get('Tasks', []))
+
+    #All parents done, remove the machine itself
+    if len(parents) == 0:
+        RemoveMachine(machineId, params['Machine_Type'])
+        BumpVersions('Machines', 'Machine_Types')
+        return True
+
+    jobs = [(pid, machineId, params['Today']) for pid in parents[:maxWorkers]]
+
+    for deleted, deactivated in ParallelMap(CascadeParent, jobs):
+        AddProgress(job, ChildrenDeleted=deleted, ChildrenDeactivated=deactivated)
+
+    AddProgress(job, ParentsProcessed=len(jobs))
+    ParentsChanged()
+
+    return False
+
+#UpdateFrequency job, removes future open children then writes new ones
+#Params: ParentId, Today, Frequency, Due_Dates, Template (child fields)
+def UpdateFrequencyStep(job):
+
+    params = job['Params']
+    pid = params['ParentId']
+
+    #Grab future children of Parent that aren't complete
+    children, job['Cursor'] = ChildPage(pid, job['Cursor'], params['Today'],
+        FilterExpression="Completed = :comp",
+        ExpressionAttributeValues= {
+            ':comp' : 0
+        }
+    )
+
+    #Delete Future Children
+    with GetThreadTable('Child_Tasks').batch_writer() as batch:
+        for child in children:
+            batch.delete_item(
+                Key = {
+                    'Parent_Id' : pid,
+                    'Due_Date' : child['Due_Date']
+                }
+            )
+
+    AddProgress(job, ChildrenDeleted=len(children))
+
+    #More children to go
+    if job['Cursor'] is not None:
+        return False
+
+    template = params['Template']
+
+    #Create Child Instances from new Start Date
+    with GetThreadTable('Child_Tasks').batch_writer() as batch:
+        for nextDue in params['Due_Dates']:
+            batch.put_item(
+                Item = {
+                    'Parent_Id' : pid,
+                    'Due_Date': nextDue,
+                    'Due_Month': nextDue[:6],
+                    'Due_Time': template['Due_Time'],
+                    'Machine_Id': template['Machine_Id'],
+                    'Machine_Name': template['Machine_Name'],
+                    'Task_Name' : template['Task_Name'],
+                    'Frequency': params['Frequency'],
+                    'Completed' : 0,
+                    'Late'  : 0,
+                    'Completed_By' : '',
+                    'Completed_DateTime': '',
+                    'Active' : 1
+                }
+            )
+
+    AddProgress(job, ChildrenCreated=len(params['Due_Dates']))
+
+    return True
+
+#UpdateChildren job, copies attributes onto every child of a parent
+#Params: ParentId, Updates ({attribute: value})
+def UpdateChildrenStep(job):
+
+    params = job['Params']
+    pid = params['ParentId']
+
+    children, job['Cursor'] = ChildPage(pid, job['Cursor'],
+        ProjectionExpression='Due_Date'
+    )
+
+    #Updates for this page run concurrently
+    updates = [(pid, child['Due_Date'], attribute, value)
+                    for child in children
+                    for attribute, value in params['Updates'].items()]
+    ParallelMap(UpdateChild, updates)
+
+    AddProgress(job, ChildrenUpdated=len(children))
+
+    #More children to go
+    if job['Cursor'] is not None:
+        return False
+
+    #Past children show the new values in history exports
+    BumpVersions(historyNamespace)
+    return True
+
+#Job types run by the task worker
+jobSteps = {
+    'DeleteTask': DeleteTaskStep,
+    'DeleteMachine': DeleteMachineStep,
+    'UpdateFrequency': UpdateFrequencyStep,
+    'UpdateChildren': UpdateChildrenStep
+}
@@ -0,0 +1,57 @@
+#Copy a parent or machine attribute onto every child instance.
+#Children are found with the Parent_Index GSI and updated concurrently,
+#since DynamoDB has no batch form of update_item.
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from paging import QueryPages
+from threads import GetThreadTable, ParallelMap
+from cache import BumpVersions, historyNamespace
+
+#Update one child, job is (parentId, dueDate, attribute, value)
+def UpdateChild(job):
+
+    pid, dueDate, attribute, value = job
+
+    try:
+        GetThreadTable('Child_Tasks').update_item(
+            Key={
+                'Parent_Id': pid,
+                'Due_Date': dueDate
+            },
+            UpdateExpression="SET #attr = :value",
+            ConditionExpression="attribute_exists(Due_Date)",
+            ExpressionAttributeNames={
+                '#attr': attribute
+            },
+            ExpressionAttributeValues={
+                ':value': value
+            },
+        )
+    except ClientError as e:
+
+        #Child was deleted since it was read, don't recreate it
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+#Set attribute to value on every child of a parent, returns count
+def UpdateChildren(pid, attribute, value):
+
+    updated = 0
+
+    #Work through the parent's children a page at a time
+    pages = QueryPages(GetThreadTable('Child_Tasks'),
+        IndexName= "Parent_Index",
+        KeyConditionExpression=Key('Parent_Id').eq(pid),
+        ProjectionExpression='Due_Date'
+    )
+
+    for page in pages:
+        jobs = [(pid, child['Due_Date'], attribute, value) for child in page]
+        ParallelMap(UpdateChild, jobs)
+        updated += len(jobs)
+
+    #Past children show the new value in history exports
+    if updated > 0:
+        BumpVersions(historyNamespace)
+
+    return updated
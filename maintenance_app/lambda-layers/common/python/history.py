@@ -0,0 +1,413 @@
+#History pipeline shared by the history views and exports.
+#Children move through it in batches (a page, or a window of parents, at
+#a time) and every stage works on a batch's columns at once:
+#   fetch    - yields lists of children (the Fetch* functions)
+#   Classify - adds a Status column (Complete, Late or Missed)
+#   Format   - adds a Completed_On column
+#   sink     - consumes the batches and builds the result (JsonSink and
+#              RollupSink here, the file sinks are in reporting/exports.py)
+#so every endpoint classifies and counts children the same way.
+#
+#The history views can also be read a page at a time: the *HistoryPage
+#fetchers fill one page and hand back the state to carry on from, which
+#goes to the client as an opaque Cursor (see EncodeCursor).
+#
+#Counting matches the rollups for past days: Complete is completed on time,
+#Late is completed after being marked late and Missed is not completed.
+import base64
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+from paging import QueryPages
+from threads import GetThreadTable, ParallelMap, ParallelScan
+from schedule import KeyOrdinal, OrdinalKey
+from cache import ChildrenBackfilled
+
+#Parallel scan segments and worker threads for history over all parents
+scanSegments = int(os.environ.get('scanSegments', '4'))
+historyWorkers = int(os.environ.get('historyWorkers', '16'))
+
+#Children per page when paging (PageSize can't go over maxPageSize)
+defaultPageSize = int(os.environ.get('historyPageSize', '100'))
+maxPageSize = 1000
+
+#Statuses a past child can have
+statusNames = ['Complete', 'Late', 'Missed']
+
+#(Completed, Late) -> Status
+statusTable = {
+    (True, True): 'Late',
+    (True, False): 'Complete',
+    (False, True): 'Missed',
+    (False, False): 'Missed'
+}
+
+#Fields the history views don't return
+hiddenFields = ['Active', 'Late', 'Completed', 'Completed_DateTime']
+
+#Due dates (past, yest) covering the last daysBack days before today
+def HistoryRange(daysBack):
+
+    yest = (datetime.now()-timedelta(days=1)).strftime('%Y%m%d')
+    past = (datetime.now()-timedelta(days=daysBack)).strftime('%Y%m%d')
+
+    return past, yest
+
+#Get a parent's active children due between past and yest
+def GetParentHistory(job):
+
+    pid, past, yest = job
+    children = []
+
+    #Query Child Table with this thread's table
+    for page in QueryPages(GetThreadTable('Child_Tasks'),
+            IndexName= "Parent_Index",
+            KeyConditionExpression=
+                Key('Parent_Id').eq(pid) &
+                Key('Due_Date').between(past, yest),
+            FilterExpression=Attr('Active').eq(1)):
+        children.extend(page)
+
+    return children
+
+#Fetch every active parent's history, a window of parents per batch so
+#   only one window of children is held in memory
+def FetchParentHistory(past, yest):
+
+    #Scan Parent Table in parallel segments (ids only)
+    parents = ParallelScan('Parent_Tasks', scanSegments,
+        FilterExpression=Attr('Active').eq(1),
+        ProjectionExpression='Parent_Id'
+    )
+
+    window = historyWorkers * 4
+
+    for i in range(0, len(parents), window):
+
+        #Query this window of parents' children concurrently
+        jobs = [(p['Parent_Id'], past, yest) for p in parents[i:i + window]]
+        batch = []
+
+        for children in ParallelMap(GetParentHistory, jobs, workers=historyWorkers):
+            batch.extend(children)
+
+        yield batch
+
+#Fetch one parent's history, a page per batch
+def FetchTaskHistory(pid, past, yest):
+
+    return QueryPages(GetThreadTable('Child_Tasks'),
+        IndexName= "Parent_Index",
+        KeyConditionExpression=
+            Key('Parent_Id').eq(pid) &
+            Key('Due_Date').between(past, yest),
+        FilterExpression=Attr('Active').eq(1)
+    )
+
+#True if a query failed because the index isn't there (or is still building)
+def IsMissingIndex(error):
+
+    return error.response['Error']['Code'] == 'ValidationException'
+
+#Ids of a machine's parent tasks, in order
+def MachineTaskIds(machineId):
+
+    machine = GetThreadTable('Machines').get_item(
+        Key={'Machine_Id': machineId},
+        ProjectionExpression='Tasks'
+    ).get('Item', {})
+
+    return sorted(machine.get('Tasks', []))
+
+#Fetch a machine's history, a page per batch
+#   Reads Machine_Index once old children have been backfilled with
+#   Machine_Id, before that it goes through the machine's parents
+def FetchMachineHistory(machineId, past, yest):
+
+    if ChildrenBackfilled():
+        try:
+            for page in QueryPages(GetThreadTable('Child_Tasks'),
+                    IndexName= "Machine_Index",
+                    KeyConditionExpression=
+                        Key('Machine_Id').eq(machineId) &
+                        Key('Due_Date').between(past, yest),
+                    FilterExpression=Attr('Active').eq(1)):
+                yield page
+            return
+        except ClientError as e:
+            if not IsMissingIndex(e):
+                raise
+
+    #Fallback - Each parent task of the machine
+    for pid in MachineTaskIds(machineId):
+        for page in FetchTaskHistory(pid, past, yest):
+            yield page
+
+#Fetch history a day at a time, first to last days back (a page per batch)
+#   This doesn't scan, so only the number of days affects latency
+def FetchDailyHistory(first, last):
+
+    for daysBack in range(first, last+1):
+
+        #Calculate key for due date
+        dueDate = (datetime.now()-timedelta(days=daysBack)).strftime('%Y%m%d')
+
+        #Get tasks due for calculated due date
+        for page in QueryPages(GetThreadTable('Child_Tasks'),
+                KeyConditionExpression=Key('Due_Date').eq(dueDate),
+                FilterExpression=Attr('Active').eq(1)):
+            yield page
+
+#Get the PageSize parameter, raises ValueError if it is out of range
+def PageSize(params):
+
+    pageSize = int(params.get('PageSize') or defaultPageSize)
+
+    if pageSize < 1 or pageSize > maxPageSize:
+        raise ValueError('PageSize must be between 1 and ' + str(maxPageSize))
+
+    return pageSize
+
+#Turn page state into an opaque cursor (None once there are no more pages)
+def EncodeCursor(state):
+
+    if state is None:
+        return None
+
+    text = json.dumps(state, sort_keys=True, separators=(',', ':'))
+
+    return base64.urlsafe_b64encode(text.encode('utf-8')).decode('ascii')
+
+#Get the page state back from a cursor, raises ValueError if it isn't one
+def DecodeCursor(cursor, fields):
+
+    try:
+        state = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+
+    if not isinstance(state, dict) or any(name not in state for name in fields):
+        raise ValueError('Invalid cursor')
+
+    return state
+
+#Run one query of at most limit items, returns (items, LastEvaluatedKey)
+def QueryLimited(table, limit, startKey, **kwargs):
+
+    if startKey:
+        kwargs['ExclusiveStartKey'] = startKey
+
+    response = table.query(Limit=limit, **kwargs)
+
+    return response['Items'], response.get('LastEvaluatedKey')
+
+#One page of history a day at a time, from Yest back to Past
+#   state: {'Past', 'Yest', 'Day', 'Key'}, returns (children, next state)
+#   The next state is None once Past has been read
+def DailyHistoryPage(state, pageSize):
+
+    table = GetThreadTable('Child_Tasks')
+    state = dict(state)
+    children = []
+
+    #Limit counts items before the Active filter, so keep asking until
+    #   the page is full or the window is done
+    while len(children) < pageSize and state['Day'] >= state['Past']:
+
+        items, state['Key'] = QueryLimited(table, pageSize - len(children), state['Key'],
+            KeyConditionExpression=Key('Due_Date').eq(state['Day']),
+            FilterExpression=Attr('Active').eq(1)
+        )
+        children.extend(items)
+
+        #Day finished, move to the one before
+        if state['Key'] is None:
+            state['Day'] = OrdinalKey(KeyOrdinal(state['Day']) - 1)
+
+    if state['Day'] < state['Past']:
+        return children, None
+
+    return children, state
+
+#One page of a machine's history from Machine_Index, oldest first
+def MachineIndexPage(state, pageSize):
+
+    table = GetThreadTable('Child_Tasks')
+    children = []
+
+    while len(children) < pageSize:
+
+        items, state['Key'] = QueryLimited(table, pageSize - len(children), state['Key'],
+            IndexName= "Machine_Index",
+            KeyConditionExpression=
+                Key('Machine_Id').eq(state['MachineId']) &
+                Key('Due_Date').between(state['Past'], state['Yest']),
+            FilterExpression=Attr('Active').eq(1)
+        )
+        children.extend(items)
+
+        #Whole window read
+        if state['Key'] is None:
+            return children, None
+
+    return children, state
+
+#One page of a machine's history a parent at a time (oldest first within
+#   each parent), state['Parent'] is the parent being read
+def MachineParentsPage(state, pageSize):
+
+    table = GetThreadTable('Child_Tasks')
+    children = []
+
+    #Parents are read in id order, carry on from the saved one
+    pids = [pid for pid in MachineTaskIds(state['MachineId']) if pid >= state['Parent']]
+
+    for i, pid in enumerate(pids):
+
+        #Start of the next parent
+        if pid != state['Parent']:
+            state['Parent'], state['Key'] = pid, None
+
+        while len(children) < pageSize:
+
+            items, state['Key'] = QueryLimited(table, pageSize - len(children), state['Key'],
+                IndexName= "Parent_Index",
+                KeyConditionExpression=
+                    Key('Parent_Id').eq(pid) &
+                    Key('Due_Date').between(state['Past'], state['Yest']),
+                FilterExpression=Attr('Active').eq(1)
+            )
+            children.extend(items)
+
+            if state['Key'] is None:
+                break
+
+        #Page full part way through this parent
+        if state['Key'] is not None:
+            return children, state
+
+        #Page full just as this parent finished
+        if len(children) >= pageSize:
+            if i + 1 == len(pids):
+                return children, None
+
+            state['Parent'], state['Key'] = pids[i + 1], None
+            return children, state
+
+    return children, None
+
+#One page of a machine's history
+#   state: {'MachineId', 'Past', 'Yest', 'Key'}, returns (children, next state)
+#   Pages read from the machine's parents also carry 'Parent' (see
+#   FetchMachineHistory for when that happens)
+#   The next state is None once the whole window has been read
+def MachineHistoryPage(state, pageSize):
+
+    state = dict(state)
+
+    if 'Parent' in state:
+        return MachineParentsPage(state, pageSize)
+
+    #First page picks the path, later ones stay on it
+    if state['Key'] is not None or ChildrenBackfilled():
+        try:
+            return MachineIndexPage(state, pageSize)
+        except ClientError as e:
+            if not IsMissingIndex(e) or state['Key'] is not None:
+                raise
+
+    state['Parent'] = ''
+
+    return MachineParentsPage(state, pageSize)
+
+#Turn batches of children into {'Children': [...], 'Status': [...]}
+def Classify(batches):
+
+    for children in batches:
+        yield {
+            'Children': children,
+            'Status': [statusTable[(bool(child['Completed']), bool(child['Late']))]
+                            for child in children]
+        }
+
+#Completion time as shown in the views and workbooks
+def DisplayTime(timestamp):
+
+    return datetime.fromtimestamp(timestamp).strftime('%c')
+
+#Completion time as ISO 8601 (CSV and Parquet exports)
+def IsoTime(timestamp):
+
+    return datetime.fromtimestamp(timestamp).isoformat()
+
+#Add a Completed_On column to classified batches (blank if not completed)
+def Format(batches, formatTime=DisplayTime):
+
+    for batch in batches:
+        batch['Completed_On'] = [
+            formatTime(float(child['Completed_DateTime'])) if status != 'Missed' else ''
+                for child, status in zip(batch['Children'], batch['Status'])]
+        yield batch
+
+#Status counts with every status present
+def NewCounts():
+
+    return Counter({name: 0 for name in statusNames})
+
+#Collect batches into the JSON the history views return
+def JsonSink(batches):
+
+    items = []
+    counts = NewCounts()
+
+    for batch in batches:
+
+        for child, status, completedOn in zip(batch['Children'], batch['Status'],
+                                              batch['Completed_On']):
+
+            #Add additional fields
+            child['Completed_On'] = completedOn
+            child['Status'] = status
+
+            #Remove Fields
+            for name in hiddenFields:
+                child.pop(name, None)
+
+            items.append(child)
+
+        counts.update(batch['Status'])
+
+    #Build result object
+    return {
+        'Items': items,
+        'Missed': counts['Missed'],
+        'Complete': counts['Complete'],
+        'Late': counts['Late']
+    }
+
+#Count classified batches per due date (same shape as ViewHistorySummary)
+def RollupSink(batches):
+
+    days = {}
+    totals = NewCounts()
+
+    for batch in batches:
+        for child, status in zip(batch['Children'], batch['Status']):
+            days.setdefault(child['Due_Date'], NewCounts())[status] += 1
+
+        totals.update(batch['Status'])
+
+    return {
+        'Days': [dict(days[day], Day=day) for day in sorted(days)],
+        'Complete': totals['Complete'],
+        'Late': totals['Late'],
+        'Missed': totals['Missed']
+    }
+
+#fetch -> Classify -> Format -> sink
+def RunPipeline(batches, sink, formatTime=DisplayTime):
+
+    return sink(Format(Classify(batches), formatTime))
@@ -0,0 +1,339 @@
+#Background jobs for work that can outlast an API call.
+#An API handler writes a job to the Jobs table, invokes a worker Lambda
+#asynchronously and returns the Job_Id straight away. The worker runs the
+#job's step function until it reports it is finished, saving the cursor
+#and progress after every step. When the worker's time is nearly up it
+#invokes itself with the same Job_Id and the next run carries on from the
+#saved cursor.
+#
+#Each invocation claims the job before running steps (a conditional update
+#on Status, Updated and the claim's Lease), and every save after that only
+#goes through while it still holds the claim. A duplicate invoke, or
+#Lambda's async retry of a run that is still going, finds the job claimed
+#and stops. A step that hits throttling is retried from its cursor. Any
+#other error marks the job Failed at its last checkpoint, and RestartJob
+#(the status API's ?Restart=true) carries on from there.
+#
+#A step function takes the job dict and returns True once the job is done.
+#It reads job['Params'], moves job['Cursor'] forward, adds to the counters
+#in job['Progress'] and can set job['Result']. A Result with Bucket and Key
+#points at a file, the status API adds a download Url for it.
+import copy
+import json
+import logging
+import os
+import time
+import uuid
+import boto3
+from datetime import datetime
+from botocore.exceptions import ClientError
+
+# Get the service resource.
+dynamodb = boto3.resource('dynamodb')
+lambda_client = boto3.client('lambda')
+s3client = boto3.client('s3')
+
+#Get Table Objects
+Job_Table = dynamodb.Table('Jobs')
+
+#Logs failed jobs
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('logLevel', 'INFO'))
+
+#Worker that runs jobs enqueued by this function
+jobWorker = os.environ.get('jobWorker')
+
+#Hand over to a new invocation once less than this much time is left (ms)
+reserveMillis = int(os.environ.get('jobReserveMillis', '60000'))
+
+#Days a finished job is kept (Expires is the table's TTL attribute)
+jobDays = int(os.environ.get('jobDays', '7'))
+
+#Tries per step when DynamoDB is throttling or briefly unavailable
+stepAttempts = int(os.environ.get('jobStepAttempts', '5'))
+
+#Errors worth trying a step again for
+transientErrors = ['ProvisionedThroughputExceededException', 'ThrottlingException',
+                   'RequestLimitExceeded', 'InternalServerError', 'ServiceUnavailable',
+                   'TransactionConflictException', 'TooManyRequestsException']
+
+#Seconds a claim lasts when the worker's own time limit isn't known
+leaseSeconds = 900
+
+#Start a worker on a job
+def InvokeWorker(worker, jobId):
+
+    lambda_client.invoke(
+        FunctionName=worker,
+        InvocationType='Event',
+        Payload=json.dumps({'Job_Id': jobId})
+    )
+
+#Save a new job and start a worker on it, returns the Job_Id
+def EnqueueJob(jobType, params, worker=None):
+
+    jobId = str(uuid.uuid4())
+    now = datetime.now().isoformat()
+
+    Job_Table.put_item(
+        Item={
+            'Job_Id': jobId,
+            'Type': jobType,
+            'Status': 'Queued',
+            'Params': params,
+            'Cursor': None,
+            'Progress': {},
+            'Worker': worker or jobWorker,
+            'Created': now,
+            'Updated': now,
+            'Expires': int(time.time()) + jobDays * 86400
+        }
+    )
+
+    InvokeWorker(worker or jobWorker, jobId)
+
+    return jobId
+
+#Get a job, None if it doesn't exist
+def GetJob(jobId):
+
+    return Job_Table.get_item(
+        Key={'Job_Id': jobId}
+    ).get('Item')
+
+#Set fields on a job
+#   owner: only save while this claim (see ClaimJob) still holds the job,
+#   raises a ConditionalCheckFailedException ClientError otherwise
+def SaveJob(jobId, owner=None, **fields):
+
+    fields['Updated'] = datetime.now().isoformat()
+    names = sorted(fields)
+
+    attributeNames = {"#" + name: name for name in names}
+    attributeValues = {":" + name: fields[name] for name in names}
+    condition = {}
+
+    if owner is not None:
+        attributeNames['#Owner'] = 'Owner'
+        attributeValues[':claim'] = owner
+        condition['ConditionExpression'] = "#Owner = :claim"
+
+    Job_Table.update_item(
+        Key={
+            'Job_Id': jobId
+        },
+        UpdateExpression="SET " + ", ".join(
+            "#" + name + " = :" + name for name in names),
+        ExpressionAttributeNames=attributeNames,
+        ExpressionAttributeValues=attributeValues,
+        **condition
+    )
+
+#True if a conditional job update failed (the claim was lost or taken)
+def IsClaimLost(error):
+
+    return (isinstance(error, ClientError) and
+            error.response['Error']['Code'] == 'ConditionalCheckFailedException')
+
+#Claim a job for one invocation until lease (epoch seconds)
+#   Only a queued job, or a running one whose last claim has run out, can
+#   be claimed, and only if nobody saved it since it was read.
+#   Returns False if another worker has it
+def ClaimJob(job, owner, lease):
+
+    now = datetime.now().isoformat()
+
+    try:
+        Job_Table.update_item(
+            Key={
+                'Job_Id': job['Job_Id']
+            },
+            UpdateExpression="SET #Status = :running, #Owner = :owner, "
+                             "#Lease = :lease, #Updated = :now",
+            ConditionExpression="#Updated = :seen AND (#Status = :queued OR "
+                                "(#Status = :running AND "
+                                "(attribute_not_exists(#Lease) OR #Lease < :time)))",
+            ExpressionAttributeNames={
+                '#Status': 'Status',
+                '#Owner': 'Owner',
+                '#Lease': 'Lease',
+                '#Updated': 'Updated'
+            },
+            ExpressionAttributeValues={
+                ':running': 'Running',
+                ':queued': 'Queued',
+                ':owner': owner,
+                ':lease': lease,
+                ':now': now,
+                ':seen': job['Updated'],
+                ':time': int(time.time())
+            },
+        )
+    except ClientError as e:
+        if not IsClaimLost(e):
+            raise
+        return False
+
+    job['Updated'] = now
+
+    return True
+
+#Queue a Failed job (or a Running one whose worker died without letting
+#go of it) again from its last checkpoint and start a worker on it
+#Returns False if the job can't be restarted
+def RestartJob(job):
+
+    try:
+        Job_Table.update_item(
+            Key={
+                'Job_Id': job['Job_Id']
+            },
+            UpdateExpression="SET #Status = :queued, #Message = :none, #Updated = :now",
+            ConditionExpression="#Status = :failed OR "
+                                "(#Status = :running AND #Lease < :time)",
+            ExpressionAttributeNames={
+                '#Status': 'Status',
+                '#Message': 'Message',
+                '#Lease': 'Lease',
+                '#Updated': 'Updated'
+            },
+            ExpressionAttributeValues={
+                ':queued': 'Queued',
+                ':failed': 'Failed',
+                ':running': 'Running',
+                ':none': None,
+                ':now': datetime.now().isoformat(),
+                ':time': int(time.time())
+            },
+        )
+    except ClientError as e:
+        if not IsClaimLost(e):
+            raise
+        return False
+
+    InvokeWorker(job.get('Worker') or jobWorker, job['Job_Id'])
+
+    return True
+
+#Add to a job's progress counters
+def AddProgress(job, **counts):
+
+    for name, amount in counts.items():
+        job['Progress'][name] = job['Progress'].get(name, 0) + amount
+
+#Seconds a result download link stays valid
+urlExpires = 900
+
+#Job as plain JSON for the status API
+def JobView(job):
+
+    result = job.get('Result')
+
+    #Jobs that leave a file in S3 get a fresh link to it
+    if isinstance(result, dict) and 'Bucket' in result and 'Key' in result:
+        result = dict(result, Url=s3client.generate_presigned_url('get_object',
+                    Params={'Bucket': result['Bucket'],
+                            'Key': result['Key']},
+                    ExpiresIn=urlExpires))
+
+    return {
+        'Job_Id': job['Job_Id'],
+        'Type': job['Type'],
+        'Status': job['Status'],
+        'Progress': {name: int(value) for name, value in job.get('Progress', {}).items()},
+        'Result': result,
+        'Message': job.get('Message'),
+        'Created': job['Created'],
+        'Updated': job['Updated']
+    }
+
+#True if an error is worth trying the step again for
+def IsTransient(error):
+
+    return (isinstance(error, ClientError) and
+            error.response['Error']['Code'] in transientErrors)
+
+#Run one step, trying it again (from the same cursor) on transient errors
+def RunStep(step, job):
+
+    cursor = copy.deepcopy(job['Cursor'])
+    progress = dict(job['Progress'])
+    delay = 0.5
+
+    for attempt in range(1, stepAttempts + 1):
+        try:
+            return step(job)
+        except Exception as e:
+
+            #Put the job back as it was before the step
+            job['Cursor'] = copy.deepcopy(cursor)
+            job['Progress'] = dict(progress)
+
+            if not IsTransient(e) or attempt == stepAttempts:
+                raise
+
+            logger.warning(json.dumps({'Job_Id': job['Job_Id'], 'Attempt': attempt,
+                                       'Error': str(e)}))
+            time.sleep(delay)
+            delay = min(delay * 2, 8.0)
+
+#Worker entry point, steps maps job Type -> step function
+#Event: {"Job_Id": <id>}
+def RunJob(event, context, steps):
+
+    jobId = event['Job_Id']
+    job = GetJob(jobId)
+
+    #Unknown, or a repeated invoke of a finished job
+    if job is None or job['Status'] in ('Done', 'Failed'):
+        return None
+
+    #Claim the job until this invocation's time is up
+    owner = str(uuid.uuid4())
+    if context is not None:
+        lease = int(time.time() + context.get_remaining_time_in_millis() / 1000.0) + 1
+    else:
+        lease = int(time.time()) + leaseSeconds
+
+    if not ClaimJob(job, owner, lease):
+        logger.info(json.dumps({'Job_Id': jobId, 'Message': 'Claimed by another worker'}))
+        return None
+
+    job['Progress'] = {name: int(value) for name, value in job.get('Progress', {}).items()}
+
+    try:
+        step = steps[job['Type']]
+
+        while not RunStep(step, job):
+
+            #Hand the rest to a fresh invocation (let go of the claim first)
+            if context is not None and context.get_remaining_time_in_millis() < reserveMillis:
+                SaveJob(jobId, owner, Cursor=job['Cursor'], Progress=job['Progress'],
+                        Status='Queued', Owner=None)
+                InvokeWorker(context.function_name, jobId)
+                return job['Progress']
+
+            #Checkpoint so a new invocation can resume here
+            SaveJob(jobId, owner, Cursor=job['Cursor'], Progress=job['Progress'])
+
+        SaveJob(jobId, owner, Status='Done', Cursor=None, Owner=None,
+                Progress=job['Progress'], Result=job.get('Result'))
+
+    except Exception as e:
+
+        #Another worker took the job over, leave it to that one
+        if IsClaimLost(e):
+            logger.warning(json.dumps({'Job_Id': jobId, 'Message': 'Claim lost'}))
+            return None
+
+        #Record the failure rather than letting Lambda retry a half run step,
+        #   the saved Cursor stays so RestartJob can resume from it
+        logger.exception(json.dumps({'Job_Id': jobId, 'Error': str(e)}))
+
+        try:
+            SaveJob(jobId, owner, Status='Failed', Message=str(e), Owner=None)
+        except ClientError as saveError:
+            if not IsClaimLost(saveError):
+                raise
+
+    return job['Progress']
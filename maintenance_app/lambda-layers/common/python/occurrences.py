@@ -0,0 +1,189 @@
+#Virtual upcoming tasks.
+#With virtualUpcoming on, future child instances are not written ahead.
+#A child is only written the day before it is due (by MaintainTasks) or
+#when someone completes it early (by CompleteTask). The upcoming views
+#work out the rest from each parent's Start_Date and Frequency.
+#
+#Parent markers in this mode:
+#   Horizon     - last due date written (None until one is)
+#   Refill_Date - next due date to write, MaintainTasks picks the parent
+#                 up once it is tomorrow or earlier
+import logging
+import os
+from botocore.exceptions import ClientError
+from schedule import CalculateDueDates, Occurrences, horizonSize, KeyOrdinal, OrdinalKey
+from cache import GetMachineNames, BumpVersions, parentsNamespace
+
+#Compute future children instead of writing them
+virtualUpcoming = os.environ.get('virtualUpcoming', '0') == '1'
+
+#Most days back a parent's missed children are written for (MaintainTasks
+#catching up after it hasn't run)
+catchUpDays = int(os.environ.get('catchUpDays', '366'))
+
+#Logs parents that can't be scheduled
+logger = logging.getLogger(__name__)
+logger.setLevel(os.environ.get('logLevel', 'INFO'))
+
+#Drop cached parent lists after parents are created, edited or deactivated
+#   (only the virtual upcoming views cache them)
+def ParentsChanged():
+
+    if virtualUpcoming:
+        BumpVersions(parentsNamespace)
+
+#Date key of the day before
+def DayBefore(key):
+
+    return OrdinalKey(KeyOrdinal(key) - 1)
+
+#Last due date written ahead (children are written the day before)
+def MaterializeThrough(today):
+
+    return OrdinalKey(KeyOrdinal(today) + 1)
+
+#Latest Refill_Date MaintainTasks handles on a run
+def RefillCutoff(today):
+
+    return MaterializeThrough(today) if virtualUpcoming else today
+
+#Date occurrences are counted from (older parents have no Start_Date)
+#   lastDue: due date of the parent's last written child (Horizon if not
+#   given). Older versions changed Frequency without moving Start_Date, so
+#   if lastDue isn't on Start_Date's schedule it carries on from lastDue.
+def ScheduleStart(parent, lastDue=None):
+
+    lastDue = lastDue or parent.get('Horizon')
+    start = parent.get('Start_Date')
+
+    if not start:
+        return str(lastDue)
+
+    start = str(start)
+
+    if not lastDue or lastDue <= start:
+        return start
+
+    #Bad frequencies are reported by whoever walks the schedule
+    try:
+        onSchedule = next(Occurrences(start, parent['Frequency'],
+                                      DayBefore(lastDue))) == lastDue
+    except ValueError:
+        return start
+
+    return start if onSchedule else str(lastDue)
+
+#Due dates to write for a task, returns (dueDates, horizon, refillDate)
+#   horizon: last due date already written (None if there isn't one)
+def ScheduleThrough(start, freq, today, horizon=None):
+
+    #Write ahead as before
+    if not virtualUpcoming:
+        dueDates = CalculateDueDates(start, freq, horizonSize)
+        return dueDates, dueDates[-1], dueDates[0]
+
+    through = MaterializeThrough(today)
+    dueDates = []
+
+    #Carry on from the last date written, so days MaintainTasks missed are
+    #   written too (new tasks start from today)
+    if horizon:
+        after = max(horizon, OrdinalKey(KeyOrdinal(today) - catchUpDays))
+    else:
+        after = DayBefore(today)
+
+    #Dates after the horizon through tomorrow
+    for due in Occurrences(start, freq, after):
+        if due > through:
+            return dueDates, (dueDates[-1] if dueDates else horizon), due
+        dueDates.append(due)
+
+#Build an open child instance of a parent
+def NewChild(parent, dueDate, machineName):
+
+    return {
+        'Parent_Id' : parent['Parent_Id'],
+        'Due_Date': dueDate,
+        'Due_Month': dueDate[:6],
+        'Due_Time': parent['Completion_Time'],
+        'Machine_Id': parent['Machine_Id'],
+        'Machine_Name': machineName,
+        'Task_Name' : parent['Name'],
+        'Frequency': parent['Frequency'],
+        'Completed' : 0,
+        'Late'  : 0,
+        'Completed_By' : '',
+        'Completed_DateTime': '',
+        'Active' : 1
+    }
+
+#Write a child unless it already exists (e.g. completed early)
+#Returns True if it was written
+def PutIfMissing(table, child):
+
+    try:
+        table.put_item(
+            Item=child,
+            ConditionExpression="attribute_not_exists(Due_Date)"
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+    return True
+
+#True if dueDate is an unwritten occurrence of an active parent
+def IsVirtualDate(parent, dueDate):
+
+    if not parent.get('Active') or dueDate <= (parent.get('Horizon') or ''):
+        return False
+
+    try:
+        nextDue = next(Occurrences(ScheduleStart(parent), parent['Frequency'],
+                                   DayBefore(dueDate)))
+    except ValueError:
+        return False
+
+    return nextDue == dueDate
+
+#Children of parents due first..last that haven't been written yet
+def VirtualChildren(parents, first, last):
+
+    parents = [parent for parent in parents if parent.get('Active')]
+    names = GetMachineNames(parent['Machine_Id'] for parent in parents)
+    children = []
+
+    for parent in parents:
+
+        #Written children cover everything through Horizon
+        after = max(parent.get('Horizon') or '', DayBefore(first))
+
+        try:
+            for due in Occurrences(ScheduleStart(parent), parent['Frequency'], after):
+                if due > last:
+                    break
+
+                child = NewChild(parent, due, names.get(parent['Machine_Id'], ''))
+                child['Virtual'] = True
+                children.append(child)
+
+        #Skip tasks with a frequency that can't be scheduled
+        except ValueError as e:
+            logger.warning('Skipping ' + parent['Parent_Id'] + ': ' + str(e))
+
+    return children
+
+#Open written children plus virtual ones no written child covers
+#   written: children in the range, completed ones included
+def MergeUpcoming(written, virtual):
+
+    keys = set((child['Parent_Id'], child['Due_Date']) for child in written)
+
+    tasks = [child for child in written if not child.get('Completed')]
+    tasks.extend(child for child in virtual
+                    if (child['Parent_Id'], child['Due_Date']) not in keys)
+
+    tasks.sort(key=lambda child: (child['Due_Date'], child['Parent_Id']))
+
+    return tasks
@@ -0,0 +1,45 @@
+#Shared helpers for reading DynamoDB results one page at a time.
+#Query and Scan stop at 1 MB per call and hand back LastEvaluatedKey,
+#so anything that reads more than a single item should go through here.
+
+#Yields each page of a query as a list of items
+def QueryPages(table, **kwargs):
+
+    while True:
+        response = table.query(**kwargs)
+        yield response['Items']
+
+        #No more pages
+        if 'LastEvaluatedKey' not in response:
+            return
+
+        #Continue from where the last page stopped
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+#Yields each page of a scan as a list of items
+def ScanPages(table, **kwargs):
+
+    while True:
+        response = table.scan(**kwargs)
+        yield response['Items']
+
+        #No more pages
+        if 'LastEvaluatedKey' not in response:
+            return
+
+        #Continue from where the last page stopped
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+#Yields every item of a query, fetching pages as they are needed
+def QueryItems(table, **kwargs):
+
+    for page in QueryPages(table, **kwargs):
+        for item in page:
+            yield item
+
+#Yields every item of a scan, fetching pages as they are needed
+def ScanItems(table, **kwargs):
+
+    for page in ScanPages(table, **kwargs):
+        for item in page:
+            yield item
@@ -0,0 +1,143 @@
+#Daily completion counts kept in the Task_Rollups table.
+#Each item is keyed by Scope ('ALL', 'MACHINE#<id>' or 'PARENT#<id>')
+#and Day (the child's Due_Date) and holds Complete, Late and Missed counts.
+#
+#Counting rules (match the history reports for past days):
+#   Complete - completed before it was marked late
+#   Late     - completed after MarkLateTasks flagged it
+#   Missed   - flagged late by MarkLateTasks and still not completed
+import boto3
+from datetime import datetime
+from boto3.dynamodb.conditions import Key
+from paging import QueryItems
+from cache import BumpVersions, historyNamespace
+
+# Get the service resource.
+dynamodb = boto3.resource('dynamodb')
+
+#Get Table Objects
+Rollup_Table = dynamodb.Table('Task_Rollups')
+Parent_Table = dynamodb.Table('Parent_Tasks')
+
+#Counters stored on each rollup item
+counterNames = ['Complete', 'Late', 'Missed']
+
+#Which counter a child currently adds to (None if it isn't counted yet)
+def ChildStatus(child):
+
+    if child.get('Completed') and child.get('Late'):
+        return 'Late'
+    elif child.get('Completed'):
+        return 'Complete'
+    elif child.get('Late'):
+        return 'Missed'
+
+    return None
+
+#Get the machine a child belongs to (from the child or its parent)
+def GetMachineId(child, machineIds=None):
+
+    if 'Machine_Id' in child:
+        return child['Machine_Id']
+
+    pid = child['Parent_Id']
+
+    #Reuse lookups when handling many children of one parent
+    if machineIds is not None and pid in machineIds:
+        return machineIds[pid]
+
+    parent = Parent_Table.get_item(
+        Key={'Parent_Id': pid},
+        ProjectionExpression='Machine_Id'
+    ).get('Item', {})
+
+    machineId = parent.get('Machine_Id')
+
+    if machineIds is not None:
+        machineIds[pid] = machineId
+
+    return machineId
+
+#Rollup scopes a child is counted in
+def ChildScopes(child, machineId):
+
+    scopes = ['ALL', 'PARENT#' + child['Parent_Id']]
+
+    if machineId:
+        scopes.append('MACHINE#' + machineId)
+
+    return scopes
+
+#Add a change for one child to a dict of pending deltas
+#deltas: {(scope, day): {counter: amount}}
+def AddDelta(deltas, child, counter, amount, machineIds=None):
+
+    #Nothing to record
+    if counter is None or amount == 0:
+        return deltas
+
+    machineId = GetMachineId(child, machineIds)
+
+    for scope in ChildScopes(child, machineId):
+        counts = deltas.setdefault((scope, child['Due_Date']), {})
+        counts[counter] = counts.get(counter, 0) + amount
+
+    return deltas
+
+#Record a child moving from one counter to another
+def MoveChild(deltas, child, oldCounter, newCounter, machineIds=None):
+
+    if oldCounter == newCounter:
+        return deltas
+
+    AddDelta(deltas, child, oldCounter, -1, machineIds)
+    AddDelta(deltas, child, newCounter, 1, machineIds)
+
+    return deltas
+
+#Write pending deltas, one update per rollup item
+#Worker threads pass in their own table (see threads.GetThreadTable)
+def ApplyDeltas(deltas, table=None):
+
+    table = table or Rollup_Table
+    today = datetime.now().strftime('%Y%m%d')
+    pastChanged = False
+
+    for (scope, day), counts in deltas.items():
+
+        #Skip items where the changes cancel out
+        counts = {name: amount for name, amount in counts.items() if amount != 0}
+        if len(counts) == 0:
+            continue
+
+        pastChanged = pastChanged or day < today
+
+        names = sorted(counts)
+
+        table.update_item(
+            Key={
+                'Scope': scope,
+                'Day': day
+            },
+            UpdateExpression="ADD " + ", ".join(
+                "#" + name + " :" + name for name in names),
+            ExpressionAttributeNames={
+                "#" + name: name for name in names
+            },
+            ExpressionAttributeValues={
+                ":" + name: counts[name] for name in names
+            },
+        )
+
+    #History exports of those days are out of date
+    if pastChanged:
+        BumpVersions(historyNamespace)
+
+#Get the rollup items for a scope between two days (inclusive)
+def ReadRollups(scope, past, yest):
+
+    return QueryItems(Rollup_Table,
+        KeyConditionExpression=
+            Key('Scope').eq(scope) &
+            Key('Day').between(past, yest)
+    )
@@ -0,0 +1,321 @@
+#Due date arithmetic for task frequencies.
+#Dates are kept as 'YYYYMMDD' keys (as stored in Child_Tasks). Day based
+#frequencies work on day ordinals and month based ones on a month count,
+#so a whole run of due dates is made with integer adds instead of a
+#strptime/strftime round trip per date.
+#
+#Month steps are always taken from the start date and clamped to the end
+#of the month, so Jan 31 gives Feb 28/29, Mar 31, Apr 30, ...
+#
+#Besides the named frequencies a task's Frequency can be a recurrence rule
+#in RRULE style (the RRULE: prefix is optional):
+#   FREQ=DAILY;INTERVAL=3                    every 3 days
+#   FREQ=WEEKLY;INTERVAL=2;BYDAY=MO,TH       Mon and Thu of every 2nd week
+#   FREQ=MONTHLY;BYDAY=2TU                   2nd Tuesday of each month
+#   FREQ=MONTHLY;INTERVAL=3;BYDAY=-1FR       last Friday of every quarter
+#   FREQ=MONTHLY;INTERVAL=2                  start's day of every 2nd month
+#   FREQ=HOURLY;INTERVAL=250;HOURSPERDAY=8   every 250 run hours on a
+#                                            machine that runs 8 hours a day
+#Occurrences() walks any of these lazily, so callers only build the dates
+#they need.
+import os
+from datetime import date
+from itertools import islice
+
+#Future children kept written for each active task
+horizonSize = int(os.environ.get('horizonSize', '10'))
+
+#Frequency -> (unit, step), unit is 'D' for days or 'M' for months
+#(the Interval of a rule with the same unit)
+frequencies = {
+    'Daily': ('D', 1),
+    'Weekly': ('D', 7),
+    'Biweekly': ('D', 14),
+    'Monthly': ('M', 1),
+    'Quarterly': ('M', 3),
+    'Semiannually': ('M', 6),
+    'Yearly': ('M', 12)
+}
+
+#Days in each month of a non leap year
+monthDays = [31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31]
+
+#Number of days in a month
+def DaysInMonth(year, month):
+
+    if month == 2 and year % 4 == 0 and (year % 100 != 0 or year % 400 == 0):
+        return 29
+
+    return monthDays[month - 1]
+
+#Split a date key into (year, month, day)
+def ParseDateKey(key):
+
+    key = str(key)
+
+    return int(key[:4]), int(key[4:6]), int(key[6:8])
+
+#Build a date key from its parts
+def FormatDateKey(year, month, day):
+
+    return '%04d%02d%02d' % (year, month, day)
+
+#Get the unit and step of a frequency
+def FrequencyStep(freq):
+
+    if freq not in frequencies:
+        raise ValueError('Unsupported frequency: ' + str(freq))
+
+    return frequencies[freq]
+
+#Due dates start + first*freq ... start + (first+count-1)*freq, in order
+#For recurrence rules: occurrences first ... first+count-1 from start
+def CalculateDueDates(start, freq, count, first=0):
+
+    #Rules go through the general iterator
+    if freq not in frequencies:
+        return list(islice(Occurrences(start, freq), first, first + count))
+
+    unit, step = FrequencyStep(freq)
+    year, month, day = ParseDateKey(start)
+
+    #Day based frequencies
+    if unit == 'D':
+        base = date(year, month, day).toordinal()
+        dueDates = []
+
+        for i in range(first, first + count):
+            due = date.fromordinal(base + i * step)
+            dueDates.append(FormatDateKey(due.year, due.month, due.day))
+
+        return dueDates
+
+    #Month based frequencies, months counted from year 0
+    base = year * 12 + month - 1
+    dueDates = []
+
+    for i in range(first, first + count):
+        dueYear, dueMonth = divmod(base + i * step, 12)
+        dueMonth += 1
+        dueDates.append(FormatDateKey(dueYear, dueMonth,
+                        min(day, DaysInMonth(dueYear, dueMonth))))
+
+    return dueDates
+
+#Date key add frequency periods after start (add=0 is start itself)
+def CalculateNextDate(start, freq, add):
+
+    return CalculateDueDates(start, freq, 1, add)[0]
+
+#BYDAY weekday codes (Monday is 0, as in date.weekday())
+weekdayCodes = ['MO', 'TU', 'WE', 'TH', 'FR', 'SA', 'SU']
+
+#Rule FREQ -> unit used by Occurrences (H is run hours)
+ruleUnits = {'DAILY': 'D', 'WEEKLY': 'W', 'MONTHLY': 'M', 'HOURLY': 'H'}
+
+#Turn a frequency (name or rule) into a rule dict
+#   Unit: 'D', 'W', 'M' or 'H'
+#   Interval: days, weeks, months or run hours between occurrences
+#   Weekdays: BYDAY weekdays (0-6), Nth: which one in the month (0 = all)
+#   HoursPerDay: run hours per calendar day (Unit 'H')
+def ParseRule(freq):
+
+    #Named frequencies are fixed day or month steps
+    if freq in frequencies:
+        unit, step = frequencies[freq]
+        return {'Unit': unit, 'Interval': step, 'Weekdays': [], 'Nth': 0}
+
+    parts = {}
+    text = str(freq).strip()
+
+    if text.upper().startswith('RRULE:'):
+        text = text[6:]
+
+    for part in text.split(';'):
+        if '=' not in part:
+            raise ValueError('Unsupported frequency: ' + str(freq))
+        name, value = part.split('=', 1)
+        parts[name.strip().upper()] = value.strip().upper()
+
+    if parts.get('FREQ') not in ruleUnits:
+        raise ValueError('Unsupported frequency: ' + str(freq))
+
+    rule = {
+        'Unit': ruleUnits[parts['FREQ']],
+        'Interval': int(parts.get('INTERVAL', '1')),
+        'Weekdays': [],
+        'Nth': 0
+    }
+
+    #BYDAY entries like MO or (monthly) 2TU / -1FR, one Nth for all of them
+    for code in filter(None, parts.get('BYDAY', '').split(',')):
+        if code[-2:] not in weekdayCodes:
+            raise ValueError('Unsupported BYDAY: ' + code)
+        rule['Weekdays'].append(weekdayCodes.index(code[-2:]))
+        if len(code) > 2:
+            rule['Nth'] = int(code[:-2])
+
+    rule['Weekdays'].sort()
+
+    if rule['Unit'] == 'H':
+        rule['HoursPerDay'] = int(parts.get('HOURSPERDAY', '24'))
+
+    #Rules that would never move forward
+    if rule['Interval'] < 1 or rule.get('HoursPerDay', 1) < 1 or abs(rule['Nth']) > 5:
+        raise ValueError('Unsupported frequency: ' + str(freq))
+    if rule['Unit'] != 'M' and rule['Nth'] != 0:
+        raise ValueError('BYDAY positions are only allowed with FREQ=MONTHLY')
+
+    return rule
+
+#True if a frequency can be scheduled
+def IsValidFrequency(freq):
+
+    try:
+        ParseRule(freq)
+    except ValueError:
+        return False
+
+    return True
+
+#Date key of a day ordinal
+def OrdinalKey(ordinal):
+
+    day = date.fromordinal(ordinal)
+
+    return FormatDateKey(day.year, day.month, day.day)
+
+#Ordinal of a date key
+def KeyOrdinal(key):
+
+    return date(*ParseDateKey(key)).toordinal()
+
+#Day ordinals a monthly rule falls on in one month, in order
+def MonthOrdinals(rule, year, month, startDay):
+
+    days = DaysInMonth(year, month)
+    first = date(year, month, 1).toordinal()
+
+    #Same day of month as the start date
+    if len(rule['Weekdays']) == 0:
+        return [first + min(startDay, days) - 1]
+
+    firstWeekday = (first - 1) % 7
+    lastWeekday = (first + days - 2) % 7
+    dayNumbers = []
+
+    for weekday in rule['Weekdays']:
+
+        #Every matching weekday in the month
+        if rule['Nth'] == 0:
+            day = 1 + (weekday - firstWeekday) % 7
+            dayNumbers.extend(range(day, days + 1, 7))
+
+        #Nth from the start of the month
+        elif rule['Nth'] > 0:
+            day = 1 + (weekday - firstWeekday) % 7 + (rule['Nth'] - 1) * 7
+            if day <= days:
+                dayNumbers.append(day)
+
+        #Nth from the end of the month
+        else:
+            day = days - (lastWeekday - weekday) % 7 + (rule['Nth'] + 1) * 7
+            if day >= 1:
+                dayNumbers.append(day)
+
+    return [first + day - 1 for day in sorted(dayNumbers)]
+
+#Lazily yield the due dates of a frequency from start, in order
+#   after: only dates later than this key (jumps ahead without walking
+#          every earlier occurrence)
+def Occurrences(start, freq, after=None):
+
+    rule = ParseRule(freq)
+    base = KeyOrdinal(start)
+    interval = rule['Interval']
+
+    #First ordinal that may be yielded
+    floor = base if after is None else max(base, KeyOrdinal(after) + 1)
+
+    #Every Interval days
+    if rule['Unit'] == 'D':
+        i = -(-(floor - base) // interval)
+        while True:
+            yield OrdinalKey(base + i * interval)
+            i += 1
+
+    #Every Interval run hours, k-th one is k*Interval/HoursPerDay days in
+    elif rule['Unit'] == 'H':
+        perDay = rule['HoursPerDay']
+        k = -(-(floor - base) * perDay // interval)
+        last = None
+        while True:
+            offset = k * interval // perDay
+
+            #Several occurrences can land on one day
+            if offset != last:
+                yield OrdinalKey(base + offset)
+                last = offset
+            k += 1
+
+    #Listed weekdays of every Interval weeks (from the start's week)
+    elif rule['Unit'] == 'W':
+        weekdays = rule['Weekdays'] or [(base - 1) % 7]
+        weekStart = base - (base - 1) % 7
+        step = 7 * interval
+        w = max(0, (floor - weekStart) // step)
+        while True:
+            for weekday in weekdays:
+                ordinal = weekStart + w * step + weekday
+                if ordinal >= floor:
+                    yield OrdinalKey(ordinal)
+            w += 1
+
+    #Every Interval months (from the start's month)
+    else:
+        year, month, day = ParseDateKey(start)
+        firstMonth = year * 12 + month - 1
+        floorDate = date.fromordinal(floor)
+        j = max(0, (floorDate.year * 12 + floorDate.month - 1 - firstMonth) // interval)
+        while True:
+            dueYear, dueMonth = divmod(firstMonth + j * interval, 12)
+            for ordinal in MonthOrdinals(rule, dueYear, dueMonth + 1, day):
+                if ordinal >= floor:
+                    yield OrdinalKey(ordinal)
+            j += 1
+
+#Next count due dates of a frequency after a date, without storing them
+def NextOccurrences(start, freq, count, after=None):
+
+    return list(islice(Occurrences(start, freq, after), count))
+
+#Compare against the strptime/relativedelta version this replaced
+#   python schedule.py
+if __name__ == '__main__':
+    import timeit
+    from datetime import datetime, timedelta
+    from dateutil.relativedelta import relativedelta
+
+    def OldCalculateNextDate(start, freq, add):
+        nextDate = datetime.strptime(str(start), '%Y%m%d')
+        if freq == 'Daily':
+            nextDate += timedelta(days=add)
+        elif freq == 'Weekly':
+            nextDate += timedelta(weeks=add)
+        elif freq == 'Monthly':
+            nextDate += relativedelta(months=add)
+        return nextDate.strftime('%Y%m%d')
+
+    #Same answers for the old frequencies
+    for freq in ['Daily', 'Weekly', 'Monthly']:
+        for start in ['20200131', '20200229', '20211231', '20230615']:
+            old = [OldCalculateNextDate(start, freq, i) for i in range(0, 400)]
+            assert CalculateDueDates(start, freq, 400) == old, (start, freq)
+
+    #10 due dates for each of 1000 parents
+    for freq in ['Daily', 'Monthly']:
+        old = timeit.timeit(lambda: [[OldCalculateNextDate('20200131', freq, i)
+                                      for i in range(0, 10)] for p in range(0, 1000)], number=5) / 5
+        new = timeit.timeit(lambda: [CalculateDueDates('20200131', freq, 10)
+                                     for p in range(0, 1000)], number=5) / 5
+        print('%-8s old %.1f ms  new %.1f ms  (%.1fx)' % (freq, old * 1000, new * 1000, old / new))
@@ -0,0 +1,67 @@
+#Shared helpers for running DynamoDB calls on a thread pool.
+#Boto3 resources are not thread safe, so each worker thread builds
+#its own session/resource the first time it needs a table.
+import os
+import threading
+import boto3
+from concurrent.futures import ThreadPoolExecutor
+from paging import ScanItems
+
+#Default pool size (override with the maxWorkers env variable)
+maxWorkers = int(os.environ.get('maxWorkers', '16'))
+
+#Per thread storage for resources
+threadLocal = threading.local()
+
+#Get a Table object owned by the calling thread
+def GetThreadTable(name):
+
+    #Create Resource on first use in this thread
+    if not hasattr(threadLocal, 'resource'):
+        session = boto3.session.Session()
+        threadLocal.resource = session.resource('dynamodb')
+        threadLocal.tables = {}
+
+    #Create Table Object on first use in this thread
+    if name not in threadLocal.tables:
+        threadLocal.tables[name] = threadLocal.resource.Table(name)
+
+    return threadLocal.tables[name]
+
+#Get the DynamoDB resource owned by the calling thread
+def GetThreadResource():
+
+    #Creating any table sets up the resource
+    if not hasattr(threadLocal, 'resource'):
+        GetThreadTable('Child_Tasks')
+
+    return threadLocal.resource
+
+#Run func on each item using a bounded pool, results keep input order
+def ParallelMap(func, items, workers=None):
+
+    items = list(items)
+
+    #Nothing to do
+    if len(items) == 0:
+        return []
+
+    workers = min(workers or maxWorkers, len(items))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, items))
+
+#Scan a table with one thread per segment, returns every item
+def ParallelScan(tableName, totalSegments, **kwargs):
+
+    #Scan one segment with this thread's table
+    def ScanSegment(segment):
+        return list(ScanItems(GetThreadTable(tableName),
+            Segment=segment, TotalSegments=totalSegments, **kwargs))
+
+    items = []
+    for segmentItems in ParallelMap(ScanSegment, range(0, totalSegments),
+                                    workers=totalSegments):
+        items.extend(segmentItems)
+
+    return items
@@ -7,7 +7,8 @@ from aws_cdk import (
     aws_iam as iam,
     aws_events as events,
     aws_events_targets as targets,
-    aws_s3_deployment as s3deploy
+    aws_s3_deployment as s3deploy,
+    custom_resources as cr
 )
 import boto3
 
@@ -24,6 +25,64 @@ class MaintenanceAppStack(core.Stack):
         #Define Existing Tables
         existing_tables = dynamodb_client.list_tables()['TableNames']
 
+        #Tables made by an older deploy don't get the indexes added to the
+        #   Table definitions below, so create the first one that's missing
+        #   with UpdateTable. DynamoDB builds one index at a time: run
+        #   cdk deploy again once it's ACTIVE to add the next. Code reading
+        #   an index falls back to the old access path until then.
+        #indexes: [(index name, partition key, sort key)], keys are (name, type)
+        def AddMissingIndex(tableName, indexes):
+
+            table = dynamodb_client.describe_table(TableName=tableName)['Table']
+            current = table.get('GlobalSecondaryIndexes', [])
+
+            #Wait for an index that is still being built
+            if any(index['IndexStatus'] != 'ACTIVE' for index in current):
+                return
+
+            names = [index['IndexName'] for index in current]
+            missing = [index for index in indexes if index[0] not in names]
+
+            if not missing:
+                return
+
+            indexName, partitionKey, sortKey = missing[0]
+
+            create = {
+                'IndexName': indexName,
+                'KeySchema': [
+                    {'AttributeName': partitionKey[0], 'KeyType': 'HASH'},
+                    {'AttributeName': sortKey[0], 'KeyType': 'RANGE'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+
+            #Provisioned tables need throughput for the index too
+            if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+                create['ProvisionedThroughput'] = {
+                    'ReadCapacityUnits': table['ProvisionedThroughput']['ReadCapacityUnits'],
+                    'WriteCapacityUnits': table['ProvisionedThroughput']['WriteCapacityUnits']
+                }
+
+            cr.AwsCustomResource(
+                self, 'Add' + indexName.replace('_', ''),
+                on_create=cr.AwsSdkCall(
+                    service='DynamoDB',
+                    action='updateTable',
+                    parameters={
+                        'TableName': tableName,
+                        'AttributeDefinitions': [
+                            {'AttributeName': partitionKey[0], 'AttributeType': partitionKey[1]},
+                            {'AttributeName': sortKey[0], 'AttributeType': sortKey[1]}
+                        ],
+                        'GlobalSecondaryIndexUpdates': [{'Create': create}]
+                    },
+                    physical_resource_id=cr.PhysicalResourceId.of(tableName + '/' + indexName)
+                ),
+                policy=cr.AwsCustomResourcePolicy.from_sdk_calls(
+                    resources=[table['TableArn']])
+            )
+
         #Parent Tasks Table Definition
         ParentTable = None
         
@@ -32,11 +91,28 @@ class MaintenanceAppStack(core.Stack):
             ParentTable = ddb.Table(
                 self, 'Parent_Tasks',
                 partition_key={'name': 'Parent_Id', 'type': ddb.AttributeType.STRING},
-                table_name='Parent_Tasks'
+                table_name='Parent_Tasks',
+                stream=ddb.StreamViewType.NEW_AND_OLD_IMAGES
+            )
+
+            #Active parents ordered by when they next need children
+            ParentTable.add_global_secondary_index(
+                index_name='Refill_Index',
+                partition_key={'name': 'Active', 'type': ddb.AttributeType.NUMBER},
+                sort_key={'name': 'Refill_Date', 'type': ddb.AttributeType.STRING}
             )
-        #Find Parent Tasks Resource
+        #Find Parent Tasks Resource (and its stream if it has one)
         else:
-            ParentTable = ddb.Table.from_table_name(self, 'Parent_Tasks', 'Parent_Tasks')
+            ParentTable = ddb.Table.from_table_attributes(self, 'Parent_Tasks',
+                table_name='Parent_Tasks',
+                table_stream_arn=dynamodb_client.describe_table(
+                    TableName='Parent_Tasks')['Table'].get('LatestStreamArn')
+            )
+
+            #Refill_Index for tables made before it existed
+            AddMissingIndex('Parent_Tasks', [
+                ('Refill_Index', ('Active', 'N'), ('Refill_Date', 'S'))
+            ])
 
         #Child Tasks Table Definition
         ChildTable = None
@@ -55,10 +131,28 @@ class MaintenanceAppStack(core.Stack):
                 partition_key={'name': 'Parent_Id', 'type': ddb.AttributeType.STRING},
                 sort_key={'name': 'Due_Date', 'type': ddb.AttributeType.STRING}
             )
+
+            ChildTable.add_global_secondary_index(
+                index_name='Machine_Index',
+                partition_key={'name': 'Machine_Id', 'type': ddb.AttributeType.STRING},
+                sort_key={'name': 'Due_Date', 'type': ddb.AttributeType.STRING}
+            )
+
+            ChildTable.add_global_secondary_index(
+                index_name='Due_Month_Index',
+                partition_key={'name': 'Due_Month', 'type': ddb.AttributeType.STRING},
+                sort_key={'name': 'Due_Date', 'type': ddb.AttributeType.STRING}
+            )
         #Find Child Tasks Resource
         else:
             ChildTable = ddb.Table.from_table_name(self, 'Child_Tasks', 'Child_Tasks')
 
+            #Indexes for tables made before they existed
+            AddMissingIndex('Child_Tasks', [
+                ('Machine_Index', ('Machine_Id', 'S'), ('Due_Date', 'S')),
+                ('Due_Month_Index', ('Due_Month', 'S'), ('Due_Date', 'S'))
+            ])
+
         #Machines Table Definition
         MachineTable = None
 
@@ -67,11 +161,16 @@ class MaintenanceAppStack(core.Stack):
             MachineTable = ddb.Table(
                 self, 'Machines',
                 partition_key={'name': 'Machine_Id', 'type': ddb.AttributeType.STRING},
-                table_name='Machines'
+                table_name='Machines',
+                stream=ddb.StreamViewType.NEW_AND_OLD_IMAGES
             )
-        #Find Machines Resource
+        #Find Machines Resource (and its stream if it has one)
         else:
-            MachineTable = ddb.Table.from_table_name(self, 'Machines', 'Machines')
+            MachineTable = ddb.Table.from_table_attributes(self, 'Machines',
+                table_name='Machines',
+                table_stream_arn=dynamodb_client.describe_table(
+                    TableName='Machines')['Table'].get('LatestStreamArn')
+            )
 
         #Machine Types Table Definition
         MachineTypesTable = None
@@ -88,12 +187,71 @@ class MaintenanceAppStack(core.Stack):
             MachineTypesTable = ddb.Table.from_table_name(self,
                 'Machine_Types', 'Machine_Types')
 
+        #Task Rollups Table Definition
+        RollupTable = None
+
+        #Create Task Rollups resource
+        if 'Task_Rollups' not in existing_tables:
+            RollupTable = ddb.Table(
+                self, 'Task_Rollups',
+                partition_key={'name': 'Scope', 'type': ddb.AttributeType.STRING},
+                sort_key={'name': 'Day', 'type': ddb.AttributeType.STRING},
+                table_name='Task_Rollups'
+            )
+        #Find Task Rollups Resource
+        else:
+            RollupTable = ddb.Table.from_table_name(self,
+                'Task_Rollups', 'Task_Rollups')
+
+        #Cache Versions Table Definition
+        VersionTable = None
+
+        #Create Cache Versions resource
+        if 'Cache_Versions' not in existing_tables:
+            VersionTable = ddb.Table(
+                self, 'Cache_Versions',
+                partition_key={'name': 'Name', 'type': ddb.AttributeType.STRING},
+                table_name='Cache_Versions'
+            )
+        #Find Cache Versions Resource
+        else:
+            VersionTable = ddb.Table.from_table_name(self,
+                'Cache_Versions', 'Cache_Versions')
+
+        #Jobs Table Definition
+        JobTable = None
+
+        #Create Jobs resource (finished jobs expire)
+        if 'Jobs' not in existing_tables:
+            JobTable = ddb.Table(
+                self, 'Jobs',
+                partition_key={'name': 'Job_Id', 'type': ddb.AttributeType.STRING},
+                time_to_live_attribute='Expires',
+                table_name='Jobs'
+            )
+        #Find Jobs Resource
+        else:
+            JobTable = ddb.Table.from_table_name(self,
+                'Jobs', 'Jobs')
+
     #-------------------Global Indexes----------------------------
 
         #ParentIndex Definiton
         ParentIndex = ddb.Table.from_table_name(self, 
                 'ParentIndex', 'Child_Tasks/index/Parent_Index')
 
+        #RefillIndex Definition
+        RefillIndex = ddb.Table.from_table_name(self,
+                'RefillIndex', 'Parent_Tasks/index/Refill_Index')
+
+        #MachineIndex Definition
+        MachineIndex = ddb.Table.from_table_name(self,
+                'MachineIndex', 'Child_Tasks/index/Machine_Index')
+
+        #DueMonthIndex Definition
+        DueMonthIndex = ddb.Table.from_table_name(self,
+                'DueMonthIndex', 'Child_Tasks/index/Due_Month_Index')
+
     #-------------------S3 Buckets------------------------------
 
         #Policy Statement for S3 bucket
@@ -103,13 +261,22 @@ class MaintenanceAppStack(core.Stack):
             resources=['*']
         )
 
+        #Cached exports are rebuilt when the data changes, so old ones
+        #   can be dropped after a week
+        ExportLifecycle = s3.LifecycleRule(
+            prefix='exports/',
+            expiration=core.Duration.days(7)
+        )
+
         #Create Export History Bucket Resource
         ExportHistoryBucket = s3.Bucket(self, 'ExportHistoryBucket',
-            block_public_access=s3.BlockPublicAccess.BLOCK_ALL)
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            lifecycle_rules=[ExportLifecycle])
         
         #Create Export Machine History Bucket Resource
         ExportMachineHistoryBucket = s3.Bucket(self, 'ExportMachineHistoryBucket',
-            block_public_access=s3.BlockPublicAccess.BLOCK_ALL)
+            block_public_access=s3.BlockPublicAccess.BLOCK_ALL,
+            lifecycle_rules=[ExportLifecycle])
         
         #Create Notification Emails Bucket Resource
         NotificationBucket = s3.Bucket(self, 'NotificationEmailsBucket',
@@ -121,12 +288,83 @@ class MaintenanceAppStack(core.Stack):
             destination_bucket=NotificationBucket
         )
         
+    #-------------------Lambda Layers---------------------------
+
+        #Shared code (paging, etc.) for every function
+        CommonLayer = _lambda.LayerVersion(
+            self, 'CommonLayer',
+            code=_lambda.Code.asset('maintenance_app/lambda-layers/common'),
+            compatible_runtimes=[_lambda.Runtime.PYTHON_3_7]
+        )
+
+        #Compute upcoming children instead of writing them ahead
+        #   (cdk deploy -c virtualUpcoming=1)
+        virtualUpcoming = str(self.node.try_get_context('virtualUpcoming') or '0')
+
+        #Read upcoming children through Due_Month_Index before MaintainTasks
+        #   has marked old children backfilled, only for tables whose children
+        #   all have Due_Month (cdk deploy -c useMonthIndex=1)
+        useMonthIndex = str(self.node.try_get_context('useMonthIndex') or '0')
+
+    #------------------Job Functions/API------------------------
+
+        #Policy Statement so workers can hand a job to a new invocation
+        InvokePolicy = iam.PolicyStatement(
+            actions=['lambda:InvokeFunction'],
+            effect=iam.Effect.ALLOW,
+            resources=['*']
+        )
+
+        #Job Worker Function (runs cascades enqueued by the APIs)
+        JobWorker = _lambda.Function(
+            self, 'JobWorker',
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
+            code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
+            handler='JobWorker.JobWorkerHandler',
+            initial_policy=[InvokePolicy],
+            environment={'virtualUpcoming': virtualUpcoming},
+            memory_size=1024,
+            timeout=core.Duration.minutes(15)
+        )
+
+        #Granting Access for Job Worker
+        ParentTable.grant_full_access(JobWorker)
+        ChildTable.grant_full_access(JobWorker)
+        MachineTable.grant_full_access(JobWorker)
+        MachineTypesTable.grant_full_access(JobWorker)
+        RollupTable.grant_full_access(JobWorker)
+        VersionTable.grant_full_access(JobWorker)
+        JobTable.grant_full_access(JobWorker)
+        ParentIndex.grant_full_access(JobWorker)
+
+        #Job Status Function
+        JobStatus = _lambda.Function(
+            self, 'JobStatus',
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
+            code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
+            handler='JobStatus.JobStatusHandler',
+            initial_policy=[S3Policy, InvokePolicy],
+            environment={'jobWorker': JobWorker.function_name},
+        )
+
+        #Job Status Api
+        apigw.LambdaRestApi(
+            self, 'JobStatusApi',
+            handler=JobStatus
+        )
+
+        #Granting Access for Job Status
+        JobTable.grant_full_access(JobStatus)
+
     #------------------Machine Functions/API--------------------
 
         #View machine types function
         viewMachineTypes = _lambda.Function(
             self, 'ViewMachineTypes',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='view_machine_types.viewMachineTypesHandler',
         )
@@ -140,11 +378,13 @@ class MaintenanceAppStack(core.Stack):
         #Granting Access to view machine types
         MachineTypesTable.grant_full_access(viewMachineTypes)
         MachineTable.grant_full_access(viewMachineTypes)
+        VersionTable.grant_full_access(viewMachineTypes)
 
         #view a machine by type given machine type
         viewMachineByTypes = _lambda.Function(
             self, 'ViewMachineByTypes',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='view_machine_by_types.viewMachineByTypesHandler',
         )
@@ -158,11 +398,13 @@ class MaintenanceAppStack(core.Stack):
         #Granting Access to view machine by types
         MachineTypesTable.grant_full_access(viewMachineByTypes)
         MachineTable.grant_full_access(viewMachineByTypes)
+        VersionTable.grant_full_access(viewMachineByTypes)
 
         #view a machine given id
         viewMachine = _lambda.Function(
             self, 'ViewMachine',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='view_machine.viewMachineHandler',
         )
@@ -180,8 +422,10 @@ class MaintenanceAppStack(core.Stack):
         ViewMachineUpcomingTasks = _lambda.Function(
             self, 'ViewMachineUpcomingTasks',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='view_machine_upcoming_task.ViewMachineUpcomingTasksHandler',
+            environment={'virtualUpcoming': virtualUpcoming},
         )
 
         #View Machine Upcoming Api
@@ -195,11 +439,14 @@ class MaintenanceAppStack(core.Stack):
         ChildTable.grant_full_access(ViewMachineUpcomingTasks)
         MachineTable.grant_full_access(ViewMachineUpcomingTasks)
         ParentIndex.grant_full_access(ViewMachineUpcomingTasks)
+        MachineIndex.grant_full_access(ViewMachineUpcomingTasks)
+        VersionTable.grant_full_access(ViewMachineUpcomingTasks)
 
         #View Parents By Machine Functions
         ViewParentsByMachine = _lambda.Function(
             self, 'ViewParentsByMachine',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='ViewParentsByMachine.ViewParentsByMachineHandler',
         )
@@ -218,6 +465,7 @@ class MaintenanceAppStack(core.Stack):
         addMachine = _lambda.Function(
             self, 'AddMachine',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='add_machine.addMachineHandler',
         )
@@ -231,11 +479,13 @@ class MaintenanceAppStack(core.Stack):
         #Grant access to add machine
         MachineTable.grant_full_access(addMachine)
         MachineTypesTable.grant_full_access(addMachine)
+        VersionTable.grant_full_access(addMachine)
 
         #add new machine type to db
         addMachineType = _lambda.Function(
             self, 'AddMachineType',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='add_machine_type.addMachineTypeHandler',
         )
@@ -248,11 +498,13 @@ class MaintenanceAppStack(core.Stack):
 
         #Grant access to add machine types
         MachineTypesTable.grant_full_access(addMachineType)
+        VersionTable.grant_full_access(addMachineType)
 
         #edit machine name
         editMachineName = _lambda.Function(
             self, 'EditMachineName',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='edit_machine_name.editMachineNameHandler',
         )
@@ -265,13 +517,16 @@ class MaintenanceAppStack(core.Stack):
 
         #Grant access to edit machine
         MachineTable.grant_full_access(editMachineName)
+        VersionTable.grant_full_access(editMachineName)
 
         #delete machine
         deleteMachine = _lambda.Function(
             self, 'DeleteMachine',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='delete_machine.deleteMachineHandler',
+            environment={'jobWorker': JobWorker.function_name},
         )
 
         #Delete Machine Api
@@ -285,12 +540,17 @@ class MaintenanceAppStack(core.Stack):
         ChildTable.grant_full_access(deleteMachine)
         MachineTable.grant_full_access(deleteMachine)
         MachineTypesTable.grant_full_access(deleteMachine)
+        RollupTable.grant_full_access(deleteMachine)
+        VersionTable.grant_full_access(deleteMachine)
+        JobTable.grant_full_access(deleteMachine)
+        JobWorker.grant_invoke(deleteMachine)
         ParentIndex.grant_full_access(deleteMachine)
 
         #delete machine type
         deleteMachineType = _lambda.Function(
             self, 'DeleteMachineType',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/machine'),
             handler='delete_machine_type.deleteMachineTypeHandler',
         )
@@ -303,6 +563,7 @@ class MaintenanceAppStack(core.Stack):
 
         #Granting Access to Delete Machine Type
         MachineTypesTable.grant_full_access(deleteMachineType)
+        VersionTable.grant_full_access(deleteMachineType)
 
     #------------------Task Functions/API---------------------
 
@@ -310,6 +571,7 @@ class MaintenanceAppStack(core.Stack):
         ViewTask = _lambda.Function(
             self, 'ViewTask',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
             handler='ViewTask.ViewTaskHandler',
         )
@@ -328,8 +590,10 @@ class MaintenanceAppStack(core.Stack):
         CreateTask = _lambda.Function(
             self, 'CreateTask',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
             handler='CreateTask.CreateTaskHandler',
+            environment={'virtualUpcoming': virtualUpcoming},
         )
 
         #Create Task Api
@@ -342,13 +606,82 @@ class MaintenanceAppStack(core.Stack):
         ChildTable.grant_full_access(CreateTask)
         ParentTable.grant_full_access(CreateTask)
         MachineTable.grant_full_access(CreateTask)
+        VersionTable.grant_full_access(CreateTask)
+
+        #Bulk Create Tasks Function
+        BulkCreateTasks = _lambda.Function(
+            self, 'BulkCreateTasks',
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
+            code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
+            handler='BulkCreateTasks.BulkCreateTasksHandler',
+            environment={'virtualUpcoming': virtualUpcoming},
+            memory_size=512,
+            timeout=core.Duration.seconds(60)
+        )
+
+        #Bulk Create Tasks Api
+        apigw.LambdaRestApi(
+            self, 'BulkCreateTasksApi',
+            handler=BulkCreateTasks
+        )
+
+        #Granting Access for Bulk Create Tasks
+        ChildTable.grant_full_access(BulkCreateTasks)
+        ParentTable.grant_full_access(BulkCreateTasks)
+        MachineTable.grant_full_access(BulkCreateTasks)
+        VersionTable.grant_full_access(BulkCreateTasks)
+
+        #Propagate Names Function (Parent_Tasks/Machines stream worker)
+        PropagateNames = _lambda.Function(
+            self, 'PropagateNames',
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
+            code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
+            handler='PropagateNames.PropagateNamesHandler',
+            memory_size=512,
+            timeout=core.Duration.minutes(5)
+        )
+
+        #Granting Access for Propagate Names
+        ChildTable.grant_full_access(PropagateNames)
+        ParentIndex.grant_full_access(PropagateNames)
+        MachineTable.grant_full_access(PropagateNames)
+        VersionTable.grant_full_access(PropagateNames)
+
+        #Feed each table's stream to the worker
+        #   Existing tables are only looked up, their streams are never turned
+        #   on here. Without one, renames go through EditTask synchronously
+        #   (Parent_Tasks) or don't reach the children at all (Machines), so
+        #   enable NEW_AND_OLD_IMAGES streams on them by hand to use this
+        namesAsync = ParentTable.table_stream_arn is not None
+        for table, name in [(ParentTable, 'ParentStream'), (MachineTable, 'MachineStream')]:
+            if table.table_stream_arn is None:
+                core.Annotations.of(self).add_warning(
+                    table.table_name + ' has no stream, enable ' +
+                    'NEW_AND_OLD_IMAGES on it for async name propagation')
+            else:
+                table.grant_stream_read(PropagateNames)
+                _lambda.EventSourceMapping(
+                    self, name + 'Mapping',
+                    target=PropagateNames,
+                    event_source_arn=table.table_stream_arn,
+                    starting_position=_lambda.StartingPosition.LATEST,
+                    batch_size=100
+                )
 
         #Edit Task Function
         EditTask = _lambda.Function(
             self, 'EditTask',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
             handler='EditTask.EditTaskHandler',
+            environment={
+                'propagateAsync': '1' if namesAsync else '0',
+                'jobWorker': JobWorker.function_name,
+                'virtualUpcoming': virtualUpcoming
+            },
             timeout=core.Duration.seconds(30)
         )
 
@@ -363,13 +696,22 @@ class MaintenanceAppStack(core.Stack):
         ParentIndex.grant_full_access(EditTask)
         ParentTable.grant_full_access(EditTask)
         MachineTable.grant_full_access(EditTask)
+        VersionTable.grant_full_access(EditTask)
+        JobTable.grant_full_access(EditTask)
+        JobWorker.grant_invoke(EditTask)
 
         #View Upcoming Tasks Function
         ViewUpcomingTasks = _lambda.Function(
             self, 'ViewUpcomingTasks',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
-            handler='ViewUpcomingTasks.ViewUpcomingTasksHandler'
+            handler='ViewUpcomingTasks.ViewUpcomingTasksHandler',
+            environment={
+                'virtualUpcoming': virtualUpcoming,
+                'useMonthIndex': useMonthIndex
+            },
+            timeout=core.Duration.seconds(10)
         )
 
         #View Upcoming Tasks API
@@ -380,13 +722,23 @@ class MaintenanceAppStack(core.Stack):
 
         #Granting Access for View Upcoming Tasks
         ChildTable.grant_full_access(ViewUpcomingTasks)
+        DueMonthIndex.grant_full_access(ViewUpcomingTasks)
+        ParentTable.grant_full_access(ViewUpcomingTasks)
+        RefillIndex.grant_full_access(ViewUpcomingTasks)
+        MachineTable.grant_full_access(ViewUpcomingTasks)
+        VersionTable.grant_full_access(ViewUpcomingTasks)
 
         #Delete Task Function
         DeleteTask = _lambda.Function(
             self, 'DeleteTask',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
             handler='DeleteTask.DeleteTaskHandler',
+            environment={
+                'jobWorker': JobWorker.function_name,
+                'virtualUpcoming': virtualUpcoming
+            },
             timeout=core.Duration.seconds(30)
         )
 
@@ -401,13 +753,19 @@ class MaintenanceAppStack(core.Stack):
         ParentIndex.grant_full_access(DeleteTask)
         ParentTable.grant_full_access(DeleteTask)
         MachineTable.grant_full_access(DeleteTask)
+        RollupTable.grant_full_access(DeleteTask)
+        JobTable.grant_full_access(DeleteTask)
+        VersionTable.grant_full_access(DeleteTask)
+        JobWorker.grant_invoke(DeleteTask)
 
         #Complete Task Function
         CompleteTask = _lambda.Function(
             self, 'CompleteTask',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
             handler='CompleteTask.CompleteTaskHandler',
+            environment={'virtualUpcoming': virtualUpcoming},
             timeout=core.Duration.seconds(10)
         )
 
@@ -419,6 +777,10 @@ class MaintenanceAppStack(core.Stack):
 
         #Granting Access for Complete Task
         ChildTable.grant_full_access(CompleteTask)
+        ParentTable.grant_full_access(CompleteTask)
+        RollupTable.grant_full_access(CompleteTask)
+        MachineTable.grant_full_access(CompleteTask)
+        VersionTable.grant_full_access(CompleteTask)
 
     #------------------Reporting Functions/API------------------
         
@@ -426,6 +788,7 @@ class MaintenanceAppStack(core.Stack):
         ViewMachineHistory = _lambda.Function(
             self, 'ViewMachineHistory',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
             handler='ViewMachineHistory.ViewMachineHistoryHandler',
             timeout=core.Duration.seconds(30)
@@ -441,13 +804,18 @@ class MaintenanceAppStack(core.Stack):
         ChildTable.grant_full_access(ViewMachineHistory)
         MachineTable.grant_full_access(ViewMachineHistory)
         ParentIndex.grant_full_access(ViewMachineHistory)
+        MachineIndex.grant_full_access(ViewMachineHistory)
+        VersionTable.grant_full_access(ViewMachineHistory)
         
         # View History Function
         ViewHistory = _lambda.Function(
             self, 'ViewHistory',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
             handler='ViewHistory.ViewHistoryHandler',
+            memory_size=512,
+            environment={'scanSegments': '4', 'historyWorkers': '16'},
             timeout=core.Duration.seconds(30)
         )
 
@@ -462,14 +830,72 @@ class MaintenanceAppStack(core.Stack):
         ParentIndex.grant_full_access(ViewHistory)
         ParentTable.grant_full_access(ViewHistory)
 
+        #View History Summary Function
+        ViewHistorySummary = _lambda.Function(
+            self, 'ViewHistorySummary',
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
+            code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
+            handler='ViewHistorySummary.ViewHistorySummaryHandler',
+            environment={'scanSegments': '4', 'historyWorkers': '16'},
+            timeout=core.Duration.seconds(30)
+        )
+
+        #View History Summary Api
+        apigw.LambdaRestApi(
+            self, 'ViewHistorySummaryApi',
+            handler=ViewHistorySummary
+        )
+
+        #Granting Access for View History Summary
+        RollupTable.grant_full_access(ViewHistorySummary)
+        ChildTable.grant_full_access(ViewHistorySummary)
+        ParentTable.grant_full_access(ViewHistorySummary)
+        ParentIndex.grant_full_access(ViewHistorySummary)
+        MachineIndex.grant_full_access(ViewHistorySummary)
+        MachineTable.grant_full_access(ViewHistorySummary)
+        VersionTable.grant_full_access(ViewHistorySummary)
+
+        #Export Worker Function (builds exports enqueued with Async=true)
+        ExportWorker = _lambda.Function(
+            self, 'ExportWorker',
+            runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
+            code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
+            handler='ExportWorker.ExportWorkerHandler',
+            initial_policy=[S3Policy, InvokePolicy],
+            memory_size=1024,
+            environment={
+                'scanSegments': '4',
+                'historyWorkers': '16'
+            },
+            timeout=core.Duration.minutes(15)
+        )
+
+        #Granting Access for Export Worker
+        ChildTable.grant_full_access(ExportWorker)
+        ParentTable.grant_full_access(ExportWorker)
+        ParentIndex.grant_full_access(ExportWorker)
+        MachineIndex.grant_full_access(ExportWorker)
+        MachineTable.grant_full_access(ExportWorker)
+        JobTable.grant_full_access(ExportWorker)
+        VersionTable.grant_full_access(ExportWorker)
+
         #Export History Function
         ExportHistory = _lambda.Function(
             self, 'ExportHistory',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
             handler='ExportHistory.ExportHistoryHandler',
             initial_policy=[S3Policy],
-            environment={'bucketName': ExportHistoryBucket.bucket_name},
+            memory_size=512,
+            environment={
+                'bucketName': ExportHistoryBucket.bucket_name,
+                'scanSegments': '4',
+                'historyWorkers': '16',
+                'jobWorker': ExportWorker.function_name
+            },
             timeout=core.Duration.seconds(30)
         )
 
@@ -483,15 +909,22 @@ class MaintenanceAppStack(core.Stack):
         ChildTable.grant_full_access(ExportHistory)
         ParentTable.grant_full_access(ExportHistory)
         ParentIndex.grant_full_access(ExportHistory)
+        JobTable.grant_full_access(ExportHistory)
+        VersionTable.grant_full_access(ExportHistory)
+        ExportWorker.grant_invoke(ExportHistory)
 
         #Export Machine History Function
         ExportMachineHistory = _lambda.Function(
             self, 'ExportMachineHistory',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
             handler='ExportMachineHistory.ExportMachineHistoryHandler',
             initial_policy=[S3Policy],
-            environment={'bucketName': ExportMachineHistoryBucket.bucket_name},
+            environment={
+                'bucketName': ExportMachineHistoryBucket.bucket_name,
+                'jobWorker': ExportWorker.function_name
+            },
             timeout=core.Duration.seconds(30)
         )
 
@@ -505,11 +938,16 @@ class MaintenanceAppStack(core.Stack):
         ChildTable.grant_full_access(ExportMachineHistory)
         MachineTable.grant_full_access(ExportMachineHistory)
         ParentIndex.grant_full_access(ExportMachineHistory)
+        MachineIndex.grant_full_access(ExportMachineHistory)
+        JobTable.grant_full_access(ExportMachineHistory)
+        VersionTable.grant_full_access(ExportMachineHistory)
+        ExportWorker.grant_invoke(ExportMachineHistory)
 
         #Update Report Email Function
         UpdateReportEmail = _lambda.Function(
             self, 'UpdateReportEmail',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
             handler='UpdateReportEmail.UpdateReportEmailHandler',
             initial_policy=[S3Policy],
@@ -527,6 +965,7 @@ class MaintenanceAppStack(core.Stack):
         ViewReportEmail = _lambda.Function(
             self, 'ViewReportEmail',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
             handler='ViewReportEmail.ViewReportEmailHandler',
             initial_policy=[S3Policy],
@@ -546,14 +985,25 @@ class MaintenanceAppStack(core.Stack):
         MaintainTasks = _lambda.Function(
             self, 'MaintainTasks',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/task'),
             handler='MaintainTasks.MaintainTasksHandler',
+            memory_size=1024,
+            environment={
+                'scanSegments': '8',
+                'virtualUpcoming': virtualUpcoming
+            },
+            timeout=core.Duration.minutes(15)
         )
 
         #Grant Access for MaintainTask
         ParentTable.grant_full_access(MaintainTasks)
         ChildTable.grant_full_access(MaintainTasks)
         ParentIndex.grant_full_access(MaintainTasks)
+        RefillIndex.grant_full_access(MaintainTasks)
+        RollupTable.grant_full_access(MaintainTasks)
+        MachineTable.grant_full_access(MaintainTasks)
+        VersionTable.grant_full_access(MaintainTasks)
 
         #Rule For Maintain Tasks
         #MaintainTasksRule = events.Rule(self, 'MaintainTasksRule',
@@ -565,6 +1015,7 @@ class MaintenanceAppStack(core.Stack):
         NotifyLead = _lambda.Function(
             self, 'NotifyLead',
             runtime=_lambda.Runtime.PYTHON_3_7,
+            layers=[CommonLayer],
             code=_lambda.Code.asset('maintenance_app/lambda-functions/reporting'),
             handler='NotifyLead.NotifyLeadHandler',
             initial_policy=[S3Policy],